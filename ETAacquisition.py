@@ -0,0 +1,1378 @@
+## Shared acquisition helpers for the ETA control programs.
+# The spectrometer is read on its own thread so that drawing the live display
+# never stretches the sampling interval.  Frames are passed to the GUI through
+# a queue as (perf_counter time, counts) pairs and the Tk loop drains them at
+# its own pace.
+## 10/2026 first version: acquisition thread
+## 10/2026 preallocated time series store replaces the growing Python lists
+## 10/2026 runs are bounded by a perf_counter deadline instead of a frame count;
+#  late frames and interval jitter are summarised for the saved file header.
+## 10/2026 file writing moved here from saveFile so the headless recorder can share it.
+## 10/2026 min/max decimation of the live time series, one bin per pixel column
+## 10/2026 continuous, latest-frame-only mode for the spectrum preview
+## 10/2026 SpectrumStream: full spectra written to a growable memory-mapped file as they arrive
+## 10/2026 binary run container (.npz): counts, times, wavelengths and run settings in one file
+## 10/2026 ChannelMap: any number of monitored pixels or summed pixel bands, one gather per frame
+## 10/2026 pre-trigger: the thread reads continuously into a ring of the last seconds until trigger()
+## 10/2026 SerialWorker: power supply I/O on its own thread, replies as futures with send times
+## 10/2026 urgent SerialWorker commands (emergency stop) go ahead of the queue and cut short a reply being read
+## 10/2026 event markers (e.g. power supply start command) on the run timebase, in headers and .npz
+## 10/2026 TelemetryPoller: power supply voltage/current read through the SerialWorker during a run
+## 10/2026 FrameAverager: co-adding of consecutive frames and a pixel boxcar before channels are taken
+## 10/2026 FrameCorrector: dark and nonlinearity correction with coefficients read once per connection
+## 10/2026 StageProfiler: per-stage timing of reads, processing, drawing and GC, saved as a Chrome trace
+## 10/2026 GCGuard: cyclic garbage collection frozen and disabled for a run, pauses reported in the header
+## 10/2026 RunSequence and read_methods: unattended replicate firings with automatic file names
+## 10/2026 BackgroundWriter: runs are saved on a thread with a bounded queue; write functions return their paths
+## 10/2026 several spectrometers in one run: nearest_frames merges their frames onto one timebase,
+#  throughput_header reports each device's frame rate and USB data rate, .npz runs may carry column_times
+
+import threading
+import queue
+import collections
+import itertools
+import csv  #easier file reading
+import gc  #garbage collection
+import json
+import os #for filename and path handling
+import time
+from concurrent.futures import Future
+from time import (perf_counter)
+
+import numpy as np
+
+
+class AcquisitionThread(threading.Thread):
+    """
+    Reads spectra on a background thread and queues timestamped frames.
+
+    Parameters
+    ----------
+    read_frame : callable
+        Returns one spectrum per call, e.g. `get_intensities`.  This thread
+        is the only caller while it is running.
+
+    duration : float or None
+        Length of the run in seconds.  The run ends on the clock, not after a
+        fixed number of frames, so late frames cannot make it run long.
+        None reads until `stop` is called.
+
+    period : float
+        Integration time in seconds.  Frames arriving more than 1.5 periods
+        after the previous one are counted as late.
+
+    latest_only : bool
+        Keep only the newest frame in `latest` and queue nothing, for a
+        display that skips the frames it has no time to draw.
+
+    pretrigger : float or None
+        Seconds of frames to keep from before the run.  The thread then
+        starts armed: it reads continuously into a ring holding that many
+        seconds and queues nothing until `trigger` is called.  The trigger
+        time becomes time zero and the run lasts `duration` from there;
+        the ring is queued first, so those frames have negative times.
+
+    A `read_frame` error (USB timeout, unplugged spectrometer) ends the
+    thread and is kept in `error`, so callers can tell a run cut short from
+    a complete one.
+    """
+    def __init__(self, read_frame, duration, period, latest_only=False, pretrigger=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.read_frame = read_frame
+        self.duration = duration
+        self.period = period
+        self.latest_only = latest_only
+        self.frames = queue.Queue()
+        self.latest = None  # newest (time, counts) frame
+        self.count = 0  # frames read so far
+        self.starttime = None
+        self.late = 0  # frames that took longer than one integration period
+        self.missed = 0  # integration periods lost in those gaps
+        self.error = None  # exception that stopped the reads, if any
+        self.pretrigger = pretrigger
+        self.triggertime = None
+        self._ring = None
+        if pretrigger:
+            self._ring = collections.deque(maxlen=int(np.ceil(pretrigger / period)) + 1)
+        self._trigger_lock = threading.Lock()  # a frame goes either to the ring or to the queue
+        self._stop_event = threading.Event()
+
+    @property
+    def armed(self):
+        """True while waiting for `trigger` with a pre-trigger ring."""
+        return self._ring is not None and self.triggertime is None
+
+    def start(self):
+        self.starttime = perf_counter()  # time zero of the run, same clock as the frame times
+        if self._ring is None:
+            self.triggertime = self.starttime
+        threading.Thread.start(self)
+
+    def trigger(self):
+        """Start the run now; frames of the last `pretrigger` seconds are queued first."""
+        with self._trigger_lock:
+            triggertime = perf_counter()
+            for frame in self._ring:
+                if frame[0] >= triggertime - self.pretrigger:
+                    self.frames.put(frame)
+            self._ring.clear()
+            self.starttime = triggertime  # time zero moves to the trigger
+            self.triggertime = triggertime
+
+    def _deadline(self):
+        if self.duration is None or self.triggertime is None:
+            return float('inf')
+        return self.triggertime + self.duration + 2 * self.period  # 2 extra cycles to catch end of process
+
+    def run(self):
+        lasttime = self.starttime
+        frametime = self.starttime
+        while frametime < self._deadline() and not self._stop_event.is_set():
+            try:
+                ydata = self.read_frame()  # blocks for about one integration time
+            except Exception as e:  # reported by the caller, see error
+                self.error = e
+                break
+            frametime = perf_counter()
+            interval = frametime - lasttime
+            if interval > 1.5 * self.period:
+                self.late += 1
+                self.missed += int(round(interval / self.period)) - 1
+            lasttime = frametime
+            self.latest = (frametime, ydata)
+            self.count += 1
+            if self._ring is not None:
+                with self._trigger_lock:
+                    if self.triggertime is None:
+                        self._ring.append((frametime, ydata))
+                        continue
+            if not self.latest_only:
+                self.frames.put((frametime, ydata))
+
+    def stop(self):
+        """Ask the thread to finish after the current read."""
+        self._stop_event.set()
+
+    def running(self):
+        """True while frames are still being read or are waiting to be drained."""
+        return self.is_alive() or not self.frames.empty()
+
+    def get_frames(self, timeout=None):
+        """
+        Return every frame queued since the last call.
+
+        Never blocks unless `timeout` (s) is given; then waits that long at
+        most for the first frame.
+        """
+        frames = []
+        try:
+            if timeout is not None:
+                frames.append(self.frames.get(timeout=timeout))
+            while True:
+                frames.append(self.frames.get_nowait())
+        except queue.Empty:
+            pass
+        return frames
+
+
+SerialReply = collections.namedtuple("SerialReply", "command sent response")
+SerialReply.__doc__ = "Command text, perf_counter time it had left the port, and the reply text."
+
+class SerialWorker(threading.Thread):
+    """
+    Talks to the power supply on its own thread.
+
+    Commands are queued and run in order, except urgent ones (stop
+    commands) which go ahead of everything queued and cut short a reply
+    being read; each call returns a
+    `concurrent.futures.Future` at once, so the Tk loop never waits for the
+    port.  The GUI polls `future.done()` from `after` and reads the result
+    there (Tk must only be touched from its own thread).  `send` records
+    the perf_counter time at which the command had left the port, on the
+    same clock as the spectrometer frames.
+
+    Parameters
+    ----------
+    ser : serial.Serial
+        Port to use; it is opened when a command needs it.  Only this
+        thread should use it while the worker runs.
+    """
+    def __init__(self, ser):
+        threading.Thread.__init__(self, daemon=True)
+        self.ser = ser
+        self.log = []  # SerialReply of every command sent
+        self._jobs = queue.PriorityQueue()  # (priority, order, job); urgent jobs are priority 0
+        self._order = itertools.count()
+        self._busy = False  # a job is using the port, see send(urgent=True)
+        self._cancelled = False  # cancel_read() was called for that job
+        self._busy_lock = threading.Lock()
+
+    def call(self, function, *args, urgent=False):
+        """Run function(*args) on the serial thread; returns a Future of its result."""
+        future = Future()
+        self._jobs.put((0 if urgent else 1, next(self._order), (future, function, args)))
+        return future
+
+    def send(self, command, expect=None, listen=0.0, close=False, urgent=False):
+        """
+        Write `command` (text, sent as ASCII) and collect the reply.
+
+        With `expect` (bytes) the reply is read up to that terminator, as
+        the BK supplies answer; otherwise whatever arrives within `listen`
+        seconds is taken, as for the PSoC.  `close` closes the port
+        afterwards.  `urgent` is for stop commands: the command goes ahead
+        of the queued ones and a reply being read for an earlier command
+        ends with what has arrived.  The Future gives a `SerialReply`.
+        """
+        future = self.call(self._send, command, expect, listen, close, urgent=urgent)
+        if urgent:
+            with self._busy_lock:
+                if self._busy:
+                    self.ser.cancel_read()  # reads of the job in progress return early, the job finishes
+                    self._cancelled = True
+        return future
+
+    def stop(self):
+        self._jobs.put((2, next(self._order), None))  # after the commands already queued
+
+    def run(self):
+        while True:
+            job = self._jobs.get()[2]
+            if job is None:
+                break
+            future, function, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._busy_lock:
+                if self._cancelled:
+                    self._clear_cancel()
+                self._busy = True
+            try:
+                future.set_result(function(*args))
+            except Exception as e:  # port errors go back to the caller
+                future.set_exception(e)
+            finally:
+                with self._busy_lock:
+                    self._busy = False
+
+    def _clear_cancel(self):
+        # On POSIX cancel_read() leaves a byte in a pipe until a read sees it.  When the job
+        # had finished its reads first, the byte would end the next job's read at once.
+        self._cancelled = False
+        pipe = getattr(self.ser, "pipe_abort_read_r", None)
+        if pipe is not None:
+            try:
+                os.read(pipe, 1000)
+            except OSError:  # empty (non-blocking) or closed with the port
+                pass
+
+    def _send(self, command, expect, listen, close):
+        ser = self.ser
+        if not ser.isOpen():
+            ser.open()
+        ser.write(command.encode('ascii'))
+        ser.flush()  # returns once the bytes are out of the port
+        sent = perf_counter()
+        response = b""
+        if expect is not None:
+            response = ser.read_until(expected=expect)
+        elif listen > 0:
+            time.sleep(listen)
+            response = ser.read(ser.inWaiting())
+        if close:
+            ser.close()
+        reply = SerialReply(command, sent, response.decode('ascii', errors='replace'))
+        self.log.append(reply)
+        return reply
+
+
+class TelemetryPoller(threading.Thread):
+    """
+    Reads power supply voltage and current while a run is recorded.
+
+    Each reading is a job on the `SerialWorker`, so it never overlaps other
+    commands on the port.  `query` runs on the serial thread and returns
+    (perf_counter time of the reading, [voltage, current]).
+
+    Parameters
+    ----------
+    serialworker : SerialWorker
+        Worker that owns the port.
+
+    query : callable
+        Takes no arguments; see above.
+
+    interval : float
+        Seconds between readings; the serial link sets the lower limit.
+    """
+    def __init__(self, serialworker, query, interval=0.05):
+        threading.Thread.__init__(self, daemon=True)
+        self.serialworker = serialworker
+        self.query = query
+        self.interval = interval
+        self.times = []
+        self.values = []
+        self.errors = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            started = perf_counter()
+            try:
+                readtime, values = self.serialworker.call(self.query).result()
+                self.times.append(readtime)
+                self.values.append(values)
+            except Exception:  # a garbled or missing reply loses one reading only
+                self.errors += 1
+            self._stop_event.wait(max(0.0, self.interval - (perf_counter() - started)))
+
+    def stop(self):
+        """Ask the thread to end after the reading in progress; join() it before `readings`."""
+        self._stop_event.set()
+
+    def readings(self, starttime=0.0):
+        """Times (s, from starttime) and an array with one row of values per reading."""
+        return np.array(self.times) - starttime, np.array(self.values, dtype=float).reshape(len(self.values), -1)
+
+
+def filament_temperature(voltage, current):
+    """Filament temperature (K) from voltage and current; coefficients for the 15-volt filament."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temp = np.asarray(voltage, dtype=float) / np.asarray(current, dtype=float)
+        temp = temp ** 0.8226
+    temp = (temp * 2759.45) - 51.7749
+    temp[~np.isfinite(temp)] = 0  # no current (supply idle) or probe offsets
+    return temp
+
+
+def run_capacity(timelimit, IntTime):
+    """Number of frames to preallocate for a run of timelimit (s) at IntTime (us)."""
+    nominal = timelimit * 1000000 / IntTime
+    return int(nominal * 1.1) + 10  # margin for the extra frames at the end of a run
+
+
+class TimeSeriesBuffer:
+    """
+    Fixed-capacity store for the monitored channels of one time series.
+
+    Everything is allocated up front so that adding a frame costs the same at
+    the start and at the end of a long run.  The `times` and `channel` views
+    share memory with the store and can go straight to `Line2D.set_data` or
+    to `saveFile` without copying.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of frames, see `run_capacity`.
+
+    nchannels : int
+        Number of values kept per frame.
+    """
+    def __init__(self, capacity, nchannels):
+        self._times = np.zeros(capacity)
+        self._data = np.zeros((nchannels, capacity))  # one contiguous row per channel
+        self.count = 0
+        self.dropped = 0  # frames that arrived after the store was full
+
+    def append(self, frametime, values):
+        n = self.count
+        if n == self._times.shape[0]:
+            self.dropped += 1
+            return
+        self._times[n] = frametime
+        self._data[:, n] = values
+        self.count = n + 1
+
+    def times(self):
+        """View of the recorded frame times."""
+        return self._times[:self.count]
+
+    def channel(self, i):
+        """View of the recorded values of channel i."""
+        return self._data[i, :self.count]
+
+    def since(self, start):
+        """Views of the times and of all channels of the frames from index start on."""
+        return self._times[start:self.count], self._data[:, start:self.count]
+
+
+def parse_channel(text, wavelengths):
+    """
+    Pixel range (lo, hi) of one channel given as text.
+
+    "358.3" is the pixel at that wavelength (first pixel at or above it, as
+    the wavelength boxes of the GUI pick it) and "357.9-358.7" every pixel
+    from 357.9 to 358.7 nm, summed.  Raises ValueError for text that is not
+    a wavelength or a range on the detector.
+    """
+    parts = text.replace(" ", "").split("-", 1) if "-" in text.strip()[1:] else [text.strip()]
+    limits = [float(p) for p in parts]
+    if min(limits) < wavelengths[0] or max(limits) > wavelengths[-1]:
+        raise ValueError(text + " nm is outside " + str(wavelengths[0]) + " to " + str(wavelengths[-1]) + " nm")
+    if len(limits) == 1:
+        lo = min(int(np.searchsorted(wavelengths, limits[0], side='left')), len(wavelengths) - 1)
+        return lo, lo + 1
+    lo = int(np.searchsorted(wavelengths, min(limits), side='left'))
+    hi = int(np.searchsorted(wavelengths, max(limits), side='right'))
+    if hi <= lo:
+        raise ValueError(text + " nm contains no pixel")
+    return lo, hi
+
+
+class ChannelMap:
+    """
+    Values of the monitored channels taken from each frame in one step.
+
+    Each channel is a single pixel or a band of pixels whose counts are
+    summed.  Single pixels are one fancy-index gather; with bands a running
+    sum of the frame is taken once and every band is the difference of two
+    of its entries, so the cost hardly depends on the number or width of
+    the channels.
+
+    Parameters
+    ----------
+    wavelengths : array
+        Wavelength of each pixel, ascending.
+
+    specs : list of str
+        Channels as accepted by `parse_channel`, e.g. ["358.3", "357.9-358.7"].
+    """
+    def __init__(self, wavelengths, specs):
+        ranges = [parse_channel(str(spec), wavelengths) for spec in specs]
+        self.lo = np.array([r[0] for r in ranges], dtype=int)
+        self.hi = np.array([r[1] for r in ranges], dtype=int)
+        self.labels = [str(spec).strip() for spec in specs]  # for file headers
+        self.centres = np.array([np.mean(wavelengths[lo:hi]) for lo, hi in ranges])
+        self.pixels_only = bool(np.all(self.hi - self.lo == 1))
+        self._prefix = np.zeros(len(wavelengths) + 1)  # running sum with a leading zero
+
+    def __len__(self):
+        return self.lo.size
+
+    def extract(self, frame):
+        """Values of all channels in this frame, in the order given."""
+        if self.pixels_only:
+            return frame[self.lo]
+        np.cumsum(frame, out=self._prefix[1:])
+        return self._prefix[self.hi] - self._prefix[self.lo]
+
+
+class FrameCorrector:
+    """
+    Dark and nonlinearity correction of raw frames in NumPy.
+
+    The spectrometer's electric dark pixel indices and nonlinearity
+    coefficients are read once (`from_spectrometer`) instead of on every
+    `intensities()` call.  The correction follows seabreeze's: the dark level
+    is subtracted, then the counts are divided by the nonlinearity polynomial
+    of the dark subtracted counts.  With the nonlinearity correction alone,
+    the electric dark level is subtracted for the polynomial and added back
+    afterwards, as seabreeze does.  A stored dark frame, when set, replaces
+    the electric dark level; it only holds for the integration time it was
+    taken at (`dark_inttime`).
+
+    Parameters
+    ----------
+    npixels : int
+        Detector length.
+
+    dark_pixels : sequence of int
+        Optically masked pixels whose mean is the electric dark level.
+
+    nonlinearity : sequence of float
+        Polynomial coefficients, constant term first, as the spectrometer
+        stores them.  Empty if it has none.
+    """
+    def __init__(self, npixels, dark_pixels=(), nonlinearity=()):
+        self.dark_pixels = np.asarray(dark_pixels, dtype=int)
+        self.nonlinearity = np.trim_zeros(np.asarray(nonlinearity, dtype=float), 'b')  # unused high orders cost time
+        self.electric_dark = False  # subtract the mean of the dark pixels
+        self.linearize = False  # divide by the nonlinearity polynomial
+        self.dark_frame = None  # stored dark counts per pixel, see set_dark_frame
+        self.dark_inttime = None  # integration time (us) of the dark frame, None if unknown
+        self._out = np.empty(npixels)
+        self._poly = np.empty(npixels)
+
+    @classmethod
+    def from_spectrometer(cls, spec):
+        """Read the coefficients of a seabreeze Spectrometer; features it lacks are left empty."""
+        npixels = len(spec.wavelengths())
+        try:
+            dark_pixels = spec.f.spectrometer.get_electric_dark_pixel_indices()
+        except Exception:  # no such feature (or a simulated spectrometer)
+            dark_pixels = ()
+        try:
+            nonlinearity = spec.f.nonlinearity_coefficients.get_nonlinearity_coefficients()
+        except Exception:
+            nonlinearity = ()
+        return cls(npixels, dark_pixels, nonlinearity)
+
+    @property
+    def active(self):
+        return bool((self.electric_dark and self.dark_pixels.size) or (self.linearize and self.nonlinearity.size)
+                    or self.dark_frame is not None)
+
+    def set_dark_frame(self, frames, IntTime=None):
+        """
+        Store the mean of `frames` (raw counts, one per row) as the dark
+        frame, taken at `IntTime` microseconds; None clears it.
+        """
+        self.dark_frame = None if frames is None else np.mean(np.asarray(frames, dtype=float), axis=0)
+        self.dark_inttime = None if frames is None else IntTime
+
+    def describe(self):
+        """Corrections in use, for file headers."""
+        applied = []
+        if self.dark_frame is not None:
+            applied.append("stored dark frame" + ("" if self.dark_inttime is None else " (" + str(self.dark_inttime / 1000) + " ms)"))
+        elif self.electric_dark and self.dark_pixels.size:
+            applied.append("electric dark (" + str(self.dark_pixels.size) + " pixels)")
+        if self.linearize and self.nonlinearity.size:
+            applied.append("nonlinearity (" + ", ".join("%.6g" % c for c in self.nonlinearity) + ")")
+        return ", ".join(applied) if applied else "none"
+
+    def correct(self, frame):
+        """
+        Corrected copy of a raw frame.
+
+        The frame returned is a buffer that the next call overwrites.
+        """
+        out = self._out
+        np.copyto(out, frame)
+        offset = 0.0  # dark level taken off only for the polynomial
+        if self.dark_frame is not None:
+            np.subtract(out, self.dark_frame, out=out)
+        elif self.electric_dark and self.dark_pixels.size:
+            out -= np.mean(out[self.dark_pixels])
+        elif self.linearize and self.nonlinearity.size and self.dark_pixels.size:
+            offset = np.mean(out[self.dark_pixels])
+            out -= offset
+        if self.linearize and self.nonlinearity.size:
+            coefficients = self.nonlinearity[::-1]  # Horner's rule from the highest order
+            self._poly.fill(coefficients[0])
+            for c in coefficients[1:]:
+                np.multiply(self._poly, out, out=self._poly)
+                np.add(self._poly, c, out=self._poly)
+            np.divide(out, self._poly, out=out)
+        if offset:
+            out += offset
+        return out
+
+
+class FrameAverager:
+    """
+    Co-adds consecutive frames and smooths them across pixels.
+
+    Sits between the acquisition thread and `ChannelMap.extract`.  All work
+    is done in buffers allocated here, so a frame costs a few vector
+    operations over the detector and no new arrays.
+
+    Parameters
+    ----------
+    npixels : int
+        Detector length.
+
+    coadd : int
+        Number of consecutive frames averaged into one, 1 is off.  The
+        averaged frame is timed at the mean of the times of its frames.
+
+    boxcar : int
+        Width in pixels of a moving average along the detector, odd, 1 is
+        off.  Near the ends of the detector fewer pixels are averaged.
+    """
+    def __init__(self, npixels, coadd=1, boxcar=1):
+        self.coadd = max(int(coadd), 1)
+        self.boxcar = max(int(boxcar), 1) | 1  # odd, centred on the pixel
+        self._sum = np.zeros(npixels)
+        self._out = np.empty(npixels)
+        self._n = 0
+        self._time = 0.0
+        half = self.boxcar // 2
+        pixels = np.arange(npixels)
+        self._lo = np.clip(pixels - half, 0, npixels)
+        self._hi = np.clip(pixels + half + 1, 0, npixels)
+        self._width = (self._hi - self._lo).astype(float)
+        self._prefix = np.zeros(npixels + 1)  # running sum with a leading zero
+        self._upper = np.empty(npixels)
+
+    @property
+    def active(self):
+        return self.coadd > 1 or self.boxcar > 1
+
+    def reset(self):
+        """Discard a partly co-added frame, e.g. at the start of a run."""
+        self._sum.fill(0)
+        self._n = 0
+        self._time = 0.0
+
+    def add(self, frametime, frame):
+        """
+        Returns (time, averaged frame) once `coadd` frames are in, otherwise None.
+
+        The frame returned is a buffer that the next call overwrites; take the
+        channels from it (or copy it) before adding more frames.
+        """
+        np.add(self._sum, frame, out=self._sum)
+        self._time += frametime
+        self._n += 1
+        if self._n < self.coadd:
+            return None
+        np.divide(self._sum, self._n, out=self._out)
+        result = (self._time / self._n, self.smooth(self._out))
+        self.reset()
+        return result
+
+    def smooth(self, frame):
+        """Boxcar of `frame` into the output buffer (frame itself when boxcar is 1)."""
+        if self.boxcar == 1:
+            return frame
+        np.cumsum(frame, out=self._prefix[1:])
+        np.take(self._prefix, self._hi, out=self._upper)
+        np.take(self._prefix, self._lo, out=self._out)
+        np.subtract(self._upper, self._out, out=self._out)
+        np.divide(self._out, self._width, out=self._out)
+        return self._out
+
+
+def timing_summary(times, period):
+    """
+    Describe how regular the timebase of a run was.
+
+    `times` are the frame times in seconds and `period` the integration time in
+    seconds.  Returns a dict with the interval statistics, the number of late
+    frames (interval > 1.5 periods), the number of periods they lost, the
+    periods lost before each frame (missed_per_frame, one per frame, 0 for
+    the first) and the drift of the last frame against an
+    ideal clock started at the first frame.
+    """
+    times = np.asarray(times)
+    intervals = np.diff(times)
+    if intervals.size == 0:
+        intervals = np.zeros(1)
+    missed = np.where(intervals > 1.5 * period, np.rint(intervals / period) - 1, 0).astype(int)
+    nframes = times.size
+    summary = {
+        "frames": nframes,
+        "period": period,
+        "mean": float(np.mean(intervals)),
+        "std": float(np.std(intervals)),
+        "max": float(np.max(intervals)),
+        "late": int(np.count_nonzero(missed)),
+        "missed": int(np.sum(missed)),
+        "missed_per_frame": np.concatenate(([0], missed))[:nframes],
+        "late_times": times[1:][missed > 0] if nframes > 1 else times[:0],
+        "drift": float(times[-1] - times[0] - (nframes - 1) * period) if nframes > 1 else 0.0,
+    }
+    return summary
+
+
+def events_header(events):
+    """
+    Comment lines for event markers, e.g. [("start R 1", 0.0031)].
+
+    Times are in seconds on the time axis of the run.  `read_events` reads
+    them back from a saved text file.
+    """
+    return "\n".join("# Event " + name + " at (s) = " + str(np.around(t, 6)) for name, t in events)
+
+
+def read_events(filename):
+    """Event markers written by `events_header` in a text file, as a dict of name: time."""
+    events = {}
+    with open(filename) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break  # header is over
+            if line.startswith("# Event ") and " at (s) = " in line:
+                name, _, t = line[len("# Event "):].partition(" at (s) = ")
+                events[name] = float(t)
+    return events
+
+
+def nearest_frames(times, other_times):
+    """
+    Index of the frame of `other_times` nearest to each of `times`.
+
+    Both are ascending perf_counter based times on the same time zero, e.g.
+    the frames of two spectrometers read by their own threads.  When
+    `other_times` is empty (that device read no frames) every index is -1.
+    """
+    times = np.asarray(times)
+    other_times = np.asarray(other_times)
+    if other_times.size == 0:
+        return np.full(times.size, -1, dtype=int)
+    if other_times.size == 1:
+        return np.zeros(times.size, dtype=int)
+    index = np.clip(np.searchsorted(other_times, times), 1, other_times.size - 1)
+    index -= (times - other_times[index - 1]) < (other_times[index] - times)
+    return index
+
+
+def throughput_header(name, frames, elapsed, period, npixels, late=0, missed=0):
+    """
+    Comment line on how fast one spectrometer delivered its frames.
+
+    `frames` were read in `elapsed` seconds at an integration time of
+    `period` seconds.  The USB data rate assumes 2 bytes per pixel, as the
+    16-bit detectors send.  When every device of a run falls short of its
+    nominal rate at once, the shared USB bus is the likely limit; when only
+    one does, look at that device (or its integration time).
+    """
+    rate = (frames - 1) / elapsed if frames > 1 and elapsed > 0 else 0.0
+    header = "# Device " + name + ": frames = " + str(frames)
+    header += ", rate (frames/s) = " + str(np.around(rate, 2)) + " of " + str(np.around(1 / period, 2))
+    header += ", USB data (kB/s) = " + str(np.around(rate * npixels * 2 / 1000, 1))
+    header += ", late = " + str(late) + ", periods missed = " + str(missed)
+    return header
+
+
+def timing_header(summary):
+    """Comment lines for the saved file header, see `timing_summary`."""
+    header = "# Frames = " + str(summary["frames"])
+    header += "\n# Frame interval (ms): mean = " + str(np.around(summary["mean"] * 1000, 3))
+    header += ", std dev = " + str(np.around(summary["std"] * 1000, 3))
+    header += ", max = " + str(np.around(summary["max"] * 1000, 3))
+    header += "\n# Late frames (> 1.5 integration times) = " + str(summary["late"])
+    header += ", integration periods missed = " + str(summary["missed"])
+    header += "\n# Timebase drift against nominal (ms) = " + str(np.around(summary["drift"] * 1000, 3))
+    if summary["late"] > 0:
+        late_times = summary["late_times"][:20]  # enough to locate the gaps without flooding the header
+        header += "\n# Late frames at (s) = " + ", ".join(str(np.around(t, 4)) for t in late_times)
+        if summary["late"] > 20:
+            header += ", ... (first 20 of " + str(summary["late"]) + "; .npz runs keep the periods missed before every frame)"
+    return header
+
+
+class StageProfiler:
+    """
+    Start and end times of the stages of every frame, for finding stalls.
+
+    Callers time a stage themselves and pass the times to `record` only when
+    `enabled` is set, so a profiler that is off costs an attribute test.
+    Garbage collections are recorded through `gc.callbacks` while enabled.
+    The spans can be saved in the Chrome trace format (`save_trace`, open in
+    chrome://tracing or https://ui.perfetto.dev) and summarised per stage with
+    a histogram of durations (`summary`).
+
+    Parameters
+    ----------
+    capacity : int
+        Spans kept; the oldest are dropped first.
+    """
+    BINS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)  # histogram upper edges, then everything longer
+
+    def __init__(self, capacity=200000):
+        self.enabled = False
+        self._spans = collections.deque(maxlen=capacity)  # (stage, thread id, start, end); append is thread safe
+        self._gcstart = None
+
+    def enable(self):
+        if not self.enabled:
+            gc.callbacks.append(self._gc_callback)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            gc.callbacks.remove(self._gc_callback)
+
+    def clear(self):
+        self._spans.clear()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def record(self, stage, start, end=None):
+        """Add a span of `stage` from `start` to `end` (perf_counter, default now) on this thread."""
+        if end is None:
+            end = perf_counter()
+        self._spans.append((stage, threading.get_ident(), start, end))
+
+    def _gc_callback(self, phase, info):
+        if phase == "start":
+            self._gcstart = perf_counter()
+        elif self._gcstart is not None:
+            self.record("gc gen " + str(info["generation"]), self._gcstart)
+            self._gcstart = None
+
+    def durations(self):
+        """Dict of stage name to an array of its durations in ms."""
+        stages = collections.defaultdict(list)
+        for stage, thread, start, end in list(self._spans):
+            stages[stage].append(end - start)
+        return {stage: np.array(d) * 1000 for stage, d in stages.items()}
+
+    def summary(self):
+        """One line per stage: count, mean, median, 99th percentile and max in ms, then the histogram."""
+        edges = ("<" + str(b) for b in self.BINS_MS)
+        lines = ["# stage, n, mean, p50, p99, max (ms); spans per bin " + " ".join(edges) + " >" + str(self.BINS_MS[-1])]
+        for stage, d in sorted(self.durations().items()):
+            counts = np.histogram(d, bins=(0,) + self.BINS_MS + (np.inf,))[0]
+            lines.append("%s, %d, %.3f, %.3f, %.3f, %.3f; %s" % (stage, d.size, np.mean(d), np.percentile(d, 50),
+                         np.percentile(d, 99), np.max(d), " ".join(str(c) for c in counts)))
+        return "\n".join(lines)
+
+    def save_trace(self, filename):
+        """Write the spans as Chrome trace 'complete' events, times in microseconds."""
+        pid = os.getpid()
+        events = [{"name": stage, "cat": "eta", "ph": "X", "pid": pid, "tid": thread,
+                   "ts": start * 1e6, "dur": (end - start) * 1e6}
+                  for stage, thread, start, end in list(self._spans)]
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class GCGuard:
+    """
+    Keeps cyclic garbage collection from stalling frames during a run.
+
+    `start` collects once, moves every surviving object to the permanent
+    generation (`gc.freeze`) so later collections need not scan them, and
+    disables automatic collection.  `check` may be called between frames:
+    it reports the container allocations since the start and, past
+    `limit`, collects the youngest generation only.  That collection scans
+    every young object, so its pause grows with `limit`: well under a
+    millisecond at the default, tens of milliseconds at 200000.
+    `stop` re-enables collection, collects everything and unfreezes.  Every
+    collection from start to stop is timed, so the file header shows
+    whether any fell inside the run.  Also usable as a context manager.
+
+    Parameters
+    ----------
+    limit : int
+        Net container allocations allowed before a young collection.
+    """
+    def __init__(self, limit=10000):
+        self.limit = limit
+        self.pauses = []  # (generation, seconds, during the run)
+        self.allocations = 0  # net container allocations seen by check
+        self.running = False
+        self._enabled = True
+        self._gcstart = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if self.running:
+            return
+        self._enabled = gc.isenabled()
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+        gc.callbacks.append(self._gc_callback)
+        self.running = True
+
+    def check(self):
+        """Net allocations so far; collects generation 0 once they pass `limit`."""
+        if not self.running:
+            return self.allocations
+        count = gc.get_count()[0]
+        if count > self.limit:
+            self.allocations += count
+            gc.collect(0)
+            return self.allocations
+        return self.allocations + count
+
+    def stop(self):
+        if not self.running:
+            return
+        self.allocations += gc.get_count()[0]  # no collection here: it would be timed as inside the run
+        self.running = False  # the collection below is after the run
+        if self._enabled:
+            gc.enable()
+        gc.collect()
+        gc.unfreeze()
+        gc.callbacks.remove(self._gc_callback)
+
+    def _gc_callback(self, phase, info):
+        if phase == "start":
+            self._gcstart = perf_counter()
+        elif self._gcstart is not None:
+            self.pauses.append((info["generation"], perf_counter() - self._gcstart, self.running))
+            self._gcstart = None
+
+    def describe(self):
+        """Header lines on collections during and after the run."""
+        during = [p[1] for p in self.pauses if p[2]]
+        after = [p[1] for p in self.pauses if not p[2]]
+        text = ("# GC during run: collections = " + str(len(during)) + ", longest (ms) = "
+                + str(np.around(max(during, default=0) * 1000, 3)) + ", allocations = " + str(self.allocations))
+        text += "\n# GC after run (ms) = " + str(np.around(sum(after) * 1000, 3))
+        return text
+
+
+class MinMaxDecimator:
+    """
+    Min/max envelope of a live time series for display.
+
+    The time axis from x0 to x1 is split into one bin per pixel column and
+    each bin keeps the smallest and largest value that fell in it, so narrow
+    atomization peaks survive while the number of plotted points never
+    exceeds twice the axes width.  Only the bins touched by new frames are
+    updated, so a redraw costs the same at any point of a long run.
+
+    Parameters
+    ----------
+    x0, x1 : float
+        Time range of the axes in seconds.
+
+    ncolumns : int
+        Width of the axes in pixels.
+
+    nchannels : int
+        Number of channels decimated together.
+    """
+    def __init__(self, x0, x1, ncolumns, nchannels):
+        ncolumns = max(int(ncolumns), 1)
+        self.x0 = x0
+        self.dx = (x1 - x0) / ncolumns
+        self.ncolumns = ncolumns
+        centres = x0 + (np.arange(ncolumns) + 0.5) * self.dx
+        self._x = np.repeat(centres, 2)  # every column is plotted as (min, max)
+        self._ymin = np.full((nchannels, ncolumns), np.inf)
+        self._ymax = np.full((nchannels, ncolumns), -np.inf)
+        self._y = np.full((nchannels, 2 * ncolumns), np.nan)
+        self.used = 0  # columns up to the latest frame
+
+    def add(self, times, values):
+        """Add frames; `values` has one row per channel, as `TimeSeriesBuffer.since` returns."""
+        if len(times) == 0:
+            return
+        cols = np.clip(((np.asarray(times) - self.x0) / self.dx).astype(int), 0, self.ncolumns - 1)
+        for c in range(self._ymin.shape[0]):
+            np.minimum.at(self._ymin[c], cols, values[c])
+            np.maximum.at(self._ymax[c], cols, values[c])
+        first = cols.min()
+        last = cols.max() + 1
+        self._y[:, 2 * first:2 * last:2] = self._ymin[:, first:last]
+        self._y[:, 2 * first + 1:2 * last:2] = self._ymax[:, first:last]
+        touched = self._y[:, 2 * first:2 * last]
+        touched[np.isinf(touched)] = np.nan  # columns without frames leave a gap
+        self.used = max(self.used, last)
+
+    def xdata(self):
+        return self._x[:2 * self.used]
+
+    def ydata(self, i):
+        return self._y[i, :2 * self.used]
+
+
+class SpectrumStream:
+    """
+    Full spectra written to disk as they arrive.
+
+    Counts go to `<base>.spectra` (float32, one row per frame) and frame
+    times to `<base>.times` (float64); both are memory-mapped and grow by
+    `chunk` frames when full, so the run length is limited by disk space
+    only.  The wavelength axis and the run settings are in `<base>.json`.
+    Unused rows keep a NaN time, so `read_spectrum_stream` recovers
+    everything written before a crash.
+
+    Parameters
+    ----------
+    base : str
+        Path and name of the files without extension.
+
+    wavelengths : array
+        Wavelength of each pixel.
+
+    info : dict
+        Extra settings stored in the json file (model, integration time...).
+    """
+    def __init__(self, base, wavelengths, info=None, chunk=512):
+        self.base = base
+        self.npixels = len(wavelengths)
+        self.chunk = chunk
+        self.count = 0
+        self.capacity = 0
+        self._spectra = None
+        self._times = None
+        self.info = dict(info or {})
+        self.info["npixels"] = self.npixels
+        self.info["wavelengths"] = [float(w) for w in wavelengths]
+        open(base + ".spectra", 'wb').close()
+        open(base + ".times", 'wb').close()
+        self._write_info()
+        self._grow()
+
+    def _write_info(self):
+        self.info["frames"] = self.count
+        with open(self.base + ".json", 'w') as f:
+            json.dump(self.info, f)
+
+    def _map(self, rows):
+        self._spectra = np.memmap(self.base + ".spectra", dtype=np.float32, mode='r+', shape=(rows, self.npixels))
+        self._times = np.memmap(self.base + ".times", dtype=np.float64, mode='r+', shape=(rows,))
+
+    def _grow(self):
+        self._close_maps()
+        self.capacity += self.chunk
+        with open(self.base + ".spectra", 'r+b') as f:
+            f.truncate(self.capacity * self.npixels * 4)
+        with open(self.base + ".times", 'r+b') as f:
+            f.truncate(self.capacity * 8)
+        self._map(self.capacity)
+        self._times[self.count:] = np.nan  # marks rows not written yet
+
+    def _close_maps(self):
+        if self._spectra is not None:
+            self._spectra.flush()
+            self._times.flush()
+        self._spectra = None  # releases the mapping so the files can be resized
+        self._times = None
+
+    def append(self, frametime, ydata):
+        if self.count == self.capacity:
+            self._grow()
+            self._write_info()  # progress on disk once per chunk
+        self._spectra[self.count] = ydata
+        self._times[self.count] = frametime
+        self.count += 1
+
+    def times(self):
+        if self._times is None:  # closed with no frames, e.g. a cancelled capture
+            return np.empty(0)
+        return self._times[:self.count]
+
+    def spectra(self):
+        if self._spectra is None:
+            return np.empty((0, self.npixels), dtype=np.float32)
+        return self._spectra[:self.count]
+
+    def close(self):
+        """Trim the files to the frames written and record the final count."""
+        self._close_maps()
+        with open(self.base + ".spectra", 'r+b') as f:
+            f.truncate(self.count * self.npixels * 4)
+        with open(self.base + ".times", 'r+b') as f:
+            f.truncate(self.count * 8)
+        self._write_info()
+        if self.count > 0:
+            self._map(self.count)  # keep the data readable for saving
+
+    def rename(self, base):
+        """Move the files to a new base name (after close)."""
+        self._close_maps()
+        for ext in (".spectra", ".times", ".json"):
+            os.replace(self.base + ext, base + ext)
+        self.base = base
+        if self.count > 0:
+            self._map(self.count)
+
+    def delete(self):
+        """Remove the files, e.g. once the run has been exported."""
+        self._close_maps()
+        for ext in (".spectra", ".times", ".json"):
+            if os.path.exists(self.base + ext):
+                os.remove(self.base + ext)
+
+
+def read_spectrum_stream(base):
+    """Return (times, spectra, info) of a `SpectrumStream`, also after a crash during the run."""
+    with open(base + ".json") as f:
+        info = json.load(f)
+    npixels = info["npixels"]
+    rows = os.path.getsize(base + ".times") // 8
+    if rows == 0:
+        return np.zeros(0), np.zeros((0, npixels), dtype=np.float32), info
+    times = np.memmap(base + ".times", dtype=np.float64, mode='r', shape=(rows,))
+    count = int(np.count_nonzero(np.isfinite(times)))  # rows after the last written frame are NaN
+    spectra = np.memmap(base + ".spectra", dtype=np.float32, mode='r', shape=(rows, npixels))
+    return times[:count], spectra[:count], info
+
+
+# file name suffix and header description of the three monitored channels
+CHANNEL_FILES = ("line", "bkg", "base")
+CHANNEL_TITLES = ("Analytical Line data", "Background data", "Baseline data")
+
+class BackgroundWriter(threading.Thread):
+    """
+    Saves runs on its own thread so the next run can start at once.
+
+    Jobs run in the order submitted.  The queue holds at most `maxsize`
+    jobs and `submit` waits for room when it is full, which bounds the
+    memory held by runs waiting to be written.  A job returns the paths it
+    wrote; they are flushed to the disk (os.fsync) before its Future is
+    completed, so a save reported done survives a power cut.  A long job
+    can call `report` with the fraction done; `status` describes the
+    current job for the GUI, which polls it from `after`.
+
+    Parameters
+    ----------
+    maxsize : int
+        Jobs waiting, not counting the one being written.
+    """
+    def __init__(self, maxsize=4):
+        threading.Thread.__init__(self, daemon=True)
+        self.log = []  # (description, seconds, error or None) of every finished job
+        self.current = None  # description of the job being written
+        self.progress = None  # fraction of the current job done, None until it reports
+        self._jobs = queue.Queue(maxsize)
+
+    def submit(self, description, function, *args):
+        """Queue function(*args) as a save named `description`; returns a Future of the paths written."""
+        future = Future()
+        self._jobs.put((future, description, function, args))  # waits while the queue is full
+        return future
+
+    def report(self, fraction):
+        """Called by a job to give its progress."""
+        self.progress = fraction
+
+    def pending(self):
+        """Jobs not finished yet, including the one being written."""
+        return self._jobs.qsize() + (self.current is not None)
+
+    def status(self):
+        """
+        e.g. 'writing run_01.txt 40 %, 1 waiting', or '' when idle.  Jobs
+        that do not `report` are shown without a percentage.
+        """
+        current = self.current
+        if current is None:
+            return ""
+        progress = self.progress
+        text = "writing " + current + ("" if progress is None else " %d %%" % (progress * 100))
+        if self._jobs.qsize():
+            text += ", " + str(self._jobs.qsize()) + " waiting"
+        return text
+
+    def close(self, timeout=None):
+        """Finish the jobs already queued, then end the thread."""
+        if self.is_alive():
+            self._jobs.put(None)
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, description, function, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.current = description
+            self.progress = None
+            start = perf_counter()
+            try:
+                paths = function(*args) or []
+                for path in paths:
+                    with open(path, 'r+b') as f:
+                        os.fsync(f.fileno())
+                future.set_result(paths)
+                self.log.append((description, perf_counter() - start, None))
+            except Exception as e:  # disk errors go back to the caller
+                future.set_exception(e)
+                self.log.append((description, perf_counter() - start, e))
+            self.current = None
+
+
+def channel_names(n):
+    """File suffixes of n channels: line, bkg, base, then ch4, ch5, ..."""
+    return list(CHANNEL_FILES[:n]) + ["ch" + str(i + 1) for i in range(len(CHANNEL_FILES), n)]
+
+
+def write_timeseries(filename, data_time, channels, wavelengths, specmodel, diagnostics):
+    """
+    Write a time series as one text file per channel.
+
+    `filename` is the name picked by the user; "line", "bkg" and "base" are
+    added before the extension, and "ch4", "ch5", ... for further channels.
+    `channels` and `wavelengths` hold the counts and the wavelength (as
+    text, a range for a band) of each channel in that order.  `data_time`
+    is one array of frame times for all channels, or a list with one per
+    channel when they come from different spectrometers.  Returns the paths
+    written.
+    """
+    path_ext = os.path.splitext(filename)
+    written = []
+    if not isinstance(data_time, list):
+        data_time = [data_time] * len(channels)
+    titles = list(CHANNEL_TITLES) + ["Channel " + str(i + 1) + " data" for i in range(len(CHANNEL_TITLES), len(channels))]
+    for suffix, title, times, data, wave in zip(channel_names(len(channels)), titles, data_time, channels, wavelengths):
+        channelfile = str(path_ext[0] + suffix + path_ext[1])
+        header = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + str(wave) + "\n# " + title + " \n" + diagnostics + "\n# Time (s), Count"
+        np.savetxt(channelfile, np.transpose([times, data]), delimiter=',', newline='\n', header=header, comments='')
+        written.append(channelfile)
+    return written
+
+
+RUN_FORMAT = 1  # version of the .npz run container
+
+def counts_array(data, rows=1024):
+    """
+    Counts as uint16 when they are whole numbers within the detector range, else float32.
+
+    The check runs over `rows` frames at a time so a long capture is not
+    copied whole.  A memory-mapped capture (SpectrumStream) stays float32
+    and mapped; np.savez then writes it to the file in chunks.
+    """
+    if isinstance(data, np.memmap):
+        return data.astype(np.float32, copy=False)
+    data = np.asarray(data)
+    whole = data.size > 0
+    for start in range(0, len(data), rows):
+        block = data[start:start + rows]
+        if not (np.all(np.isfinite(block)) and block.min() >= 0 and block.max() <= 65535 and np.all(np.mod(block, 1) == 0)):
+            whole = False
+            break
+    return data.astype(np.uint16) if whole else data.astype(np.float32, copy=False)
+
+
+def save_run(filename, data_time, counts, wavelengths, specmodel, diagnostics="", channels=None, IntTime=None, slot=None, events=None,
+             column_times=None, missed_per_frame=None):
+    """
+    Write a run as one uncompressed .npz file.
+
+    `counts` has one row per frame: a column per channel for a time series,
+    or the whole spectrum for a full-spectrum capture.  `wavelengths` gives
+    the wavelength of each column and `channels` optional column names
+    (e.g. CHANNEL_FILES).  `IntTime` is in microseconds as in the GUI.
+    `events` are (name, time) markers as for `events_header`.
+    `column_times`, the same shape as `counts`, gives the time of each value
+    when columns come from different spectrometers (see `nearest_frames`);
+    `times` are then those of the first.  `missed_per_frame` gives the
+    integration periods lost before each frame (see `timing_summary`).
+    Returns the path written
+    (np.savez adds .npz when it is missing) in a list.
+    """
+    if not isinstance(counts, np.memmap):
+        counts = np.asarray(counts)
+    if counts.ndim == 1:
+        counts = counts[:, np.newaxis]
+    if channels is None:
+        channels = []
+    if events is None:
+        events = []
+    extra = {}
+    if column_times is not None:
+        extra["column_times"] = np.asarray(column_times, dtype=np.float64)
+    if missed_per_frame is not None:
+        extra["missed_per_frame"] = np.asarray(missed_per_frame, dtype=np.int32)
+    np.savez(filename, format=RUN_FORMAT, times=np.asarray(data_time, dtype=np.float64),
+             counts=counts_array(counts), wavelengths=np.asarray(wavelengths, dtype=np.float64),
+             channels=np.array(channels, dtype=str), model=str(specmodel), diagnostics=str(diagnostics),
+             integration_time_us=-1 if IntTime is None else int(IntTime),
+             slot="" if slot is None else str(slot),
+             event_names=np.array([name for name, t in events], dtype=str),
+             event_times=np.array([t for name, t in events], dtype=np.float64), **extra)
+    return [filename if filename.endswith(".npz") else filename + ".npz"]
+
+
+def load_run(filename):
+    """
+    Read a run written by `save_run`.
+
+    Returns a dict with times, counts (frames x columns), wavelengths,
+    channels (list of names, may be empty), model, diagnostics,
+    integration_time_us (None if unknown), slot, events (dict of
+    name: time, empty if none were recorded), column_times (None for a
+    run from one spectrometer) and missed_per_frame (None if not saved).
+    """
+    with np.load(filename, allow_pickle=False) as f:
+        run = {key: f[key] for key in f.files}
+    if int(run["format"]) > RUN_FORMAT:
+        raise ValueError(filename + " was written by a newer version (format " + str(run["format"]) + ")")
+    for key in ("model", "diagnostics", "slot"):
+        run[key] = str(run[key])
+    run["channels"] = [str(c) for c in run["channels"]]
+    run["integration_time_us"] = int(run["integration_time_us"]) if run["integration_time_us"] >= 0 else None
+    names = run.pop("event_names", np.array([], dtype=str))
+    times = run.pop("event_times", np.array([]))
+    run["events"] = {str(name): float(t) for name, t in zip(names, times)}
+    run.setdefault("column_times", None)
+    run.setdefault("missed_per_frame", None)
+    return run
+
+
+METHOD_FIELDS = ("name", "line", "bkg", "base", "slot", "inttime", "duration", "replicates")
+
+def read_methods(filename):
+    """
+    Methods of a run sequence from a CSV file with a header row.
+
+    Columns are any of METHOD_FIELDS: a name used in the file names, the
+    line, bkg and base wavelengths (nm), power supply slot, integration time
+    (ms), time series length (whole seconds, as the GUI box takes) and
+    number of replicates.  A missing or blank entry keeps the setting in
+    use when the method runs; lines starting with # are comments.  Raises
+    ValueError on an unknown column or a value out of range.
+    """
+    methods = []
+    with open(filename, newline='') as f:
+        rows = csv.DictReader(line for line in f if not line.startswith('#'))  # comment lines are skipped
+        for number, row in enumerate(rows, start=1):
+            row = {(key or "").strip(): (value or "").strip() for key, value in row.items()}
+            unknown = [key for key in row if key not in METHOD_FIELDS]
+            if unknown:
+                raise ValueError("unknown column " + ", ".join(unknown) + " in " + filename)
+            method = {key: value for key, value in row.items() if value}
+            method.setdefault("name", "method" + str(number))
+            try:
+                for key, kind, lo, hi in (("slot", int, 0, 7), ("inttime", int, 4, 5000),
+                                          ("duration", int, 1, 299), ("replicates", int, 1, 1000)):
+                    if key in method:
+                        method[key] = kind(method[key])
+                        if not lo <= method[key] <= hi:
+                            raise ValueError(key + " must be between " + str(lo) + " and " + str(hi))
+            except ValueError as e:
+                raise ValueError("method " + method["name"] + ": " + str(e))
+            methods.append(method)
+    if not methods:
+        raise ValueError("no methods in " + filename)
+    return methods
+
+
+class RunSequence:
+    """
+    Firings to make one after another without an operator.
+
+    Each method (see `read_methods`) is fired `replicates` times (default 1)
+    before the next one.  Run files are named <base>_<method>_<nn><ext> after
+    the name picked for the sequence; a name already used on disk gets a
+    further _2, _3, ... so nothing is overwritten.
+
+    Parameters
+    ----------
+    methods : list of dict
+        Settings of each method.
+
+    filename : str
+        Base name and extension for the run files, e.g. "runs/cal.npz".
+
+    cooldown : float
+        Seconds to wait after a run is saved before the next firing.
+    """
+    def __init__(self, methods, filename, cooldown=0.0):
+        self.base, self.extension = os.path.splitext(filename)
+        self.cooldown = cooldown
+        self.runs = [(method, replicate + 1) for method in methods for replicate in range(method.get("replicates", 1))]
+        self.index = -1  # position in runs of the current firing
+        self.filename = None  # file of the current firing
+
+    def __len__(self):
+        return len(self.runs)
+
+    def _unused(self, stem):
+        # text runs are written as <stem>line<ext>, <stem>bkg<ext>, ...
+        taken = lambda s: os.path.exists(s + self.extension) or os.path.exists(s + CHANNEL_FILES[0] + self.extension)
+        name, k = stem, 1
+        while taken(name):
+            k += 1
+            name = stem + "_" + str(k)
+        return name + self.extension
+
+    def next(self):
+        """Move to the next firing; returns (method, filename), or None when all are done."""
+        self.index += 1
+        if self.index >= len(self.runs):
+            self.filename = None
+            return None
+        method, replicate = self.runs[self.index]
+        self.filename = self._unused(self.base + "_" + method["name"] + "_%02d" % replicate)
+        return method, self.filename
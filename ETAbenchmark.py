@@ -0,0 +1,132 @@
+## Live-plotting benchmark for ETAcontrol_RC14.py.
+#  Runs the real App.update_graph / BlitManager time series path against the
+#  simulated spectrometer (ETAsimulator.py) for every combination of the
+#  settings given, and reports the achieved frame interval distribution,
+#  late frames and redraw cost.  Use the same settings on each machine or
+#  release to compare them (e.g. Pi 3B vs i5).
+#
+#  example:
+#   python ETAbenchmark.py --inttime 5 15 25 --markers . , - --traces 2 3 --duration 10 --csv pi3b.csv
+#  Needs a display (Tk window).  The window is shown while the runs are made.
+## 10/2026 first version
+## 10/2026 markevery sweep removed: the live traces are min/max decimated to the axes width (MinMaxDecimator)
+
+import argparse
+import csv  #easier file writing
+import itertools
+import os #for filename and path handling
+import platform
+import sys
+from time import (perf_counter)
+
+import numpy as np
+
+COLUMNS = ["inttime_ms", "marker", "traces", "duration_s", "frames", "interval_mean_ms",
+           "interval_p50_ms", "interval_p90_ms", "interval_p99_ms", "interval_max_ms", "late", "missed",
+           "redraws", "redraw_mean_ms", "redraw_max_ms"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark live plotting of the ETA time series.")
+    parser.add_argument("--inttime", nargs="+", type=int, default=[25], help="integration times in ms")
+    parser.add_argument("--markers", nargs="+", default=["."], help="Matplotlib markers; '-' draws a line (lw=1)")
+    parser.add_argument("--traces", nargs="+", type=int, default=[2], choices=[1, 2, 3], help="number of live traces")
+    parser.add_argument("--duration", nargs="+", type=float, default=[5], help="run lengths in s")
+    parser.add_argument("--source", default="synthetic", help="simulated signal: 'synthetic' or a zip of a saved run")
+    parser.add_argument("--csv", help="append the results to this file")
+    return parser.parse_args(argv)
+
+
+def percentile_ms(intervals, q):
+    return np.around(np.percentile(intervals, q) * 1000, 3)
+
+
+class Benchmark:
+    """Drives one App through a list of settings and collects the results."""
+    def __init__(self, eta):
+        self.eta = eta
+        self.root = eta.tk.Tk()
+        self.root.wm_title("ETA benchmark")
+        eta.open_spectrometer()  # main() normally does this on a thread behind a splash label
+        self.app = eta.App(self.root)
+        self.app.pack()
+        self.saved = []
+        self.redraws = []
+        eta.saveFile = self.capture  # no file dialog; keep the run in memory
+        update = eta.BlitManager.update
+        redraws = self.redraws
+        def timed_update(bm, *args, **kwargs):
+            t = perf_counter()
+            update(bm, *args, **kwargs)
+            redraws.append(perf_counter() - t)
+        eta.BlitManager.update = timed_update
+
+    def capture(self, data_time, *args):
+        self.saved.append(np.array(data_time))
+        self.root.quit()  # leaves mainloop, the run is complete
+
+    def run(self, inttime, marker, ntraces, duration):
+        app = self.app
+        app.IntTime = inttime * 1000
+        with self.eta.spec_lock:
+            self.eta.spec.integration_time_micros(app.IntTime)
+        app.timelimit = duration
+        for trace in app.traces:
+            if marker == "-":
+                trace.set_linestyle("-")
+                trace.set_linewidth(1)
+                trace.set_marker("None")
+            else:
+                trace.set_linestyle("None")
+                trace.set_marker(marker)
+        app.ntraces = ntraces
+        if app.DisplayCode == 1:
+            app.DisplayMode(None)  # to time series
+        else:
+            app.ax1.set_xlim(-1, app.timelimit*1.05)
+        del self.redraws[:]
+        app.update_graph()
+        self.root.mainloop()
+        xdata = self.saved.pop()
+        timing = self.eta.timing_summary(xdata, inttime / 1000)
+        intervals = np.diff(xdata)
+        redraws = np.array(self.redraws) if self.redraws else np.zeros(1)
+        return [inttime, marker, ntraces, duration, timing["frames"],
+                np.around(timing["mean"] * 1000, 3), percentile_ms(intervals, 50), percentile_ms(intervals, 90),
+                percentile_ms(intervals, 99), np.around(timing["max"] * 1000, 3), timing["late"], timing["missed"],
+                len(self.redraws), np.around(np.mean(redraws) * 1000, 3), np.around(np.max(redraws) * 1000, 3)]
+
+
+def describe_system(eta):
+    import matplotlib
+    return ("host " + platform.node() + ", " + platform.machine() + ", " + platform.platform()
+            + ", Python " + platform.python_version() + ", Matplotlib " + matplotlib.__version__
+            + ", NumPy " + np.__version__ + ", spectrometer " + eta.spec.model)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["ETA_SIMULATE"] = args.source  # must be set before the control program is imported
+    import ETAcontrol_RC14 as eta
+    bench = Benchmark(eta)
+    system = describe_system(eta)
+    print("#", system)
+    print(", ".join(COLUMNS))
+    results = []
+    for settings in itertools.product(args.inttime, args.markers, args.traces, args.duration):
+        row = bench.run(*settings)
+        results.append(row)
+        print(", ".join(str(v) for v in row))
+        sys.stdout.flush()
+    bench.root.destroy()
+    if args.csv:
+        new_file = not os.path.exists(args.csv)
+        with open(args.csv, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["system"] + COLUMNS)
+            for row in results:
+                writer.writerow([system] + row)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,13 @@
 ## current work:  add explicit Serial connect/disconnect to avoid quit when programming BK
 ## added COM dropbox 16NOV2022 ECN
 ## new scalar selection to conform to Numpy > 1.25  21FEB2024 ECN
+## 10/2026 BK commands run on a SerialWorker thread (ETAacquisition.py); GMAX no longer freezes
+#  the window for the 1 s read timeout and Measure starts recording without waiting for OK.
+## 10/2026 time the RUNP command left the port is saved as an event marker ("# Event start RUNP... at (s) =")
+## 10/2026 'Record PS telemetry': voltage and current (GETD) are polled during the run and saved with
+#  the filament temperature ("ps" and "_temperature" files, read by ReadNProcess9 Load temperature data).
+## 10/2026 note: the spectrometer is still read and drawn in the Tk callback; the acquisition thread of
+#  ETAcontrol_RC14.py (ETAacquisition.AcquisitionThread) has not been ported to this program.
 
 # Functional on all parts.
 #
@@ -48,6 +55,8 @@ import gc  #garbage collection
 import serial
 import serial.tools.list_ports
 
+from ETAacquisition import SerialWorker, TelemetryPoller, events_header, filament_temperature
+
 # Enumerate spectrometer, set a default integration time, get x & y extents
 try:
     spec = sb.Spectrometer.from_serial_number()
@@ -101,6 +110,10 @@ class App(tk.Frame):
         self.IntTimeLimits = spec.integration_time_micros_limits #BIGGER RANGE THAN REALLY EXISTS; this is available if needed;reads as tuple
         self.max_intensity = spec.max_intensity  #fullscale limit
         self.timelimit = 5 # time in SECONDS, default to 5 s for convenience
+        self.serial = SerialWorker(ser)  # all power supply I/O, off the Tk thread
+        self.serial.start()
+        self.gocommand = None  # Future of the last RUNP sent by PS_go
+        self.telemetry = None  # TelemetryPoller of the current run
         
         #preload wavelength values
         self.wavelength1 = tk.StringVar(self, self.wavelengths[int(len(self.wavelengths) * 0.8)])
@@ -219,6 +232,9 @@ class App(tk.Frame):
         self.ports_box = ttk.Combobox(self.menu_left_lower, values = scanSerial())
         self.ports_box.grid(column = 1, row = 5)
         self.ports_box.bind('<<ComboboxSelected>>', self.on_selectComm)
+        self.telemetry_on = tk.IntVar(self, 0)
+        self.telemetry_check = tk.Checkbutton(self.menu_left_lower, text='Record PS telemetry', variable=self.telemetry_on)
+        self.telemetry_check.grid(column=0, row=6, columnspan=2)
 
         # right display area -- Spectrograph Plot Area
         self.some_title_frame = tk.Frame(self, bg="#dfdfdf")
@@ -309,6 +325,17 @@ class App(tk.Frame):
                 self.bkgdata.set_data(xdata, bkgdata)
                 #self.basedata.set_data(xdata, basedata)  # not usually displayed
                 self.bm.update()  # blit manager call
+            events = []
+            if self.gocommand is not None and self.gocommand.done() and self.gocommand.exception() is None:
+                reply = self.gocommand.result()  # RUNP sent by PS_go for this run
+                events.append(("start " + reply.command.strip(), reply.sent - starttime))
+            self.gocommand = None
+            telemetry = None
+            if self.telemetry is not None:
+                self.telemetry.stop()
+                self.telemetry.join()  # at most the reading in progress; readings() needs the lists complete
+                telemetry = self.telemetry.readings(starttime)  # times on the time axis of the spectra
+                self.telemetry = None
         #diagnostics printed to terminal, can be removed ----
             #print("per point = ", str((perf_counter()-starttime)/(self.timelimit * int(1000/self.IntTime*1000))))
             #print("std dev = ", str(np.std(np.diff(xdata))))
@@ -327,7 +354,7 @@ class App(tk.Frame):
             linedata=np.asarray(linedata)
             bkgdata=np.asarray(bkgdata)
             basedata=np.asarray(basedata)
-            saveFile(xdata, linedata, bkgdata, basedata, self.wavelength1, self.wavelength2, self.wavelength3)
+            saveFile(xdata, linedata, bkgdata, basedata, self.wavelength1, self.wavelength2, self.wavelength3, events, telemetry)
 
     def wavelenaction(self):
         self.wavelength1 = self.wavelen1box.get()
@@ -516,33 +543,40 @@ class App(tk.Frame):
         #print(ser.isOpen())
         #print(ser)
         if (ser.isOpen() == True):  #checks if serial port is open
-            try:
-                self.PSconnect.configure(background = 'pink')
-                self.PStext.insert(tk.END, "disconnected serial \n")
-                ser.close()
-            except:
-                print("exception")
-                self.PSconnect.configure(background = 'pink')
+            self.PSconnect.configure(background = 'pink')
+            self.PStext.insert(tk.END, "disconnected serial \n")
+            self.serial.call(ser.close)
         else:
-            try:
-                self.PSconnect.configure(background = 'light green')
-                self.PStext.insert(tk.END, "connected serial \n")
+            self.PSconnect.configure(background = 'light green')
+            self.PStext.insert(tk.END, "connected serial \n")
+            def connect():  # runs on the serial thread
                 ser.open()
-                maxvalues = getMaxVoltCurr(ser)
-                self.PStext.insert(tk.END, str(maxvalues[1]) + " amps maximum \n")
-                self.PStext.insert(tk.END, str(maxvalues[0]) + " volts maximum \n")
-            except:
-                self.PStext.insert(tk.END, "Is another program using the serial port? Or no port selected? \n")
-                self.PSconnect.configure(background = 'pink')
+                return getMaxVoltCurr(ser)
+            self.when_done(self.serial.call(connect), self.show_maxvalues)
         #print("after def")
         #print(ser.isOpen())
-            
-                
+
+    def show_maxvalues(self, future):
+        try:
+            maxvalues = future.result()
+            self.PStext.insert(tk.END, str(maxvalues[1]) + " amps maximum \n")
+            self.PStext.insert(tk.END, str(maxvalues[0]) + " volts maximum \n")
+        except:
+            self.PStext.insert(tk.END, "Is another program using the serial port? Or no port selected? \n")
+            self.PSconnect.configure(background = 'pink')
+
+    def when_done(self, future, callback):
+        # replies of the serial thread are handled here, on the Tk thread
+        if future.done():
+            callback(future)
+        else:
+            self.after(10, self.when_done, future, callback)
+
     def on_selectComm(self, event):
         global ser
         #print (ser)
         port = self.ports_box.get()
-        ser.port = port
+        self.serial.call(setattr, ser, 'port', port)  # reopens an open port, so not on the Tk thread
         #print("after get")
         #print(ser)
 
@@ -560,8 +594,11 @@ class App(tk.Frame):
             self.PStext.insert(tk.END, "sent: ")
             self.PStext.insert(tk.END, GO_string)
             self.PStext.insert(tk.END, "\n")
-            sdpWrite("SOUT"+"%02d"%address+"0\r", serial) # connects outputs on BK 1696
-            sdpWrite("RUNP"+"%02d"%address+"%04d\r"%times, serial)
+            self.serial.send("SOUT"+"%02d"%address+"0\r", expect=b'\r') # connects outputs on BK 1696
+            self.gocommand = self.serial.send("RUNP"+"%02d"%address+"%04d\r"%times, expect=b'\r')
+            if self.telemetry_on.get():  # voltage and current between the spectra, same clock
+                self.telemetry = TelemetryPoller(self.serial, lambda: getDisplay(ser, address))
+                self.telemetry.start()
             return self.update_graph()  #start recording data
         else:
             self.PStext.insert(tk.END, "no connection")
@@ -571,14 +608,11 @@ class App(tk.Frame):
 
 
     def PS_EmergencyStop(self, event):
-        if(ser.isOpen() == False):  # check if serial port is open
-            ser.open()
         address = 0
         self.PStext.insert(tk.END, "sent: ")
         self.PStext.insert(tk.END, "STOP"+"%02d\r"%address)
         self.PStext.insert(tk.END, "\n")  # echos line feed
-        sdpWrite("STOP"+"%02d\r"%address, ser)
-        ser.flush()  # avoids accidental stray instructions
+        self.serial.send("STOP"+"%02d\r"%address, expect=b'\r', urgent=True)  # opens the port if needed
 
 def sdpWrite(cmd, serial):
     ser.write(cmd.encode())
@@ -602,6 +636,15 @@ def getMaxVoltCurr(serial, address=0):
     #return [int(resp[0:3])/10., int(resp[0][3:5])/10.]  #had to edit the parsing for Python 3, see next line
     return [int(str(int(resp))[0:3])/10., int(str(int(resp))[3:6])/100.]
 
+def getDisplay(ser, address=0):
+    """Output voltage (V) and current (A) now, as [perf_counter time, [voltage, current]]"""
+    sent = perf_counter()
+    ser.write(("GETD"+"%02d"%address+"\r").encode())
+    resp = ser.read_until(expected=b'\r')  # VVVVIIIIS: 0.01 V, 0.01 A, CV/CC status
+    received = perf_counter()
+    ser.read_until(expected=b'\r')  # OK
+    return [(sent + received) / 2, [int(resp[0:4])/100., int(resp[4:8])/100.]]
+
 def sdpQuery(cmd, serial):
     resp = []
     notDone = True
@@ -695,7 +738,7 @@ class BlitManager:
         # let the GUI event loop process anything it has to do
         cv.flush_events()
 
-def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basewave):
+def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basewave, events=(), telemetry=None):
     filenameforWriting = asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("All files", "*.*")])
     if not filenameforWriting:
         pass  #exits on Cancel
@@ -705,12 +748,21 @@ def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basew
         bkgfile = str(path_ext[0] + "bkg" + path_ext[1])
         basefile = str(path_ext[0] + "base" + path_ext[1])
         specmodel = spec.model
-        lineheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + linewave + "\n# Analytical Line data \n# Time (s), Count"
-        bkgheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + bkgwave + "\n# Background data \n# Time (s), Count"
-        baseheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + basewave + "\n# Baseline data \n# Time (s), Count"
+        eventlines = events_header(events) + "\n" if events else ""  # power supply commands on the time axis
+        lineheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + linewave + "\n# Analytical Line data \n" + eventlines + "# Time (s), Count"
+        bkgheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + bkgwave + "\n# Background data \n" + eventlines + "# Time (s), Count"
+        baseheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + basewave + "\n# Baseline data \n" + eventlines + "# Time (s), Count"
         np.savetxt(linefile, np.transpose([data_time, data_line]), delimiter=',', newline='\n', header=lineheader, comments='')
         np.savetxt(bkgfile, np.transpose([data_time, data_bkg]), delimiter=',', newline='\n', header=bkgheader, comments='')
         np.savetxt(basefile, np.transpose([data_time, data_base]), delimiter=',', newline='\n', header=baseheader, comments='')
+        if telemetry is not None and len(telemetry[0]) > 0:
+            ps_time, ps_values = telemetry
+            psfile = str(path_ext[0] + "ps" + path_ext[1])
+            psheader = "# BK Precision 1696 readings (GETD) \n" + eventlines + "# Time (s), Voltage (V), Current (A)"
+            np.savetxt(psfile, np.column_stack((ps_time, ps_values)), delimiter=',', newline='\n', header=psheader, comments='')
+            temperaturefile = str(path_ext[0] + "_temperature.txt")  # as written by ReadNProcess Calc_Temperature
+            temperatureheader = "# processed from PS readings " + os.path.basename(psfile) + " using coefficients for 15-volt filament \n# Time (s), Temperature (K)"
+            np.savetxt(temperaturefile, np.transpose([ps_time, filament_temperature(ps_values[:, 0], ps_values[:, 1])]), delimiter=',', newline='\n', header=temperatureheader, comments='')
 
 def processData():
     pass
@@ -5,6 +5,16 @@
 # Functional on all parts.
 #
 # 
+## 10/2026 atomization window is a setting; full spectra are streamed to a memory-mapped
+#          capture file (ETAacquisition.SpectrumStream) as they arrive instead of a 4 s array in RAM.
+#          An interrupted run can be recovered with ETAacquisition.read_spectrum_stream("capture_...")
+## 10/2026 saving with a .npz extension writes one binary run file instead of the text matrix
+## 10/2026 the spectra are written by a background thread (ETAacquisition.BackgroundWriter) once the
+#          file name is chosen, so the next run can start while the text matrix is still being written;
+#          progress is shown in the title bar.  Closing the window waits for saves still queued.
+## 10/2026 note: the spectrometer is still read in the Tk callback (update_graph loop), not on the
+#          ETAacquisition.AcquisitionThread used by ETAcontrol_RC14.py; frame timing is as before.
+## 10/2026 the capture file is deleted once the run is saved; on Cancel it is kept only if asked to
 
 try:
     import Tkinter as tk
@@ -38,6 +48,8 @@ import gc  #garbage collection
 import serial
 import serial.tools.list_ports
 
+from ETAacquisition import SpectrumStream, save_run, BackgroundWriter
+
 # Enumerate spectrometer, set a default integration time, get x & y extents
 try:
     spec = sb.Spectrometer.from_serial_number()
@@ -90,6 +102,9 @@ class App(tk.Frame):
         self.IntTimeLimits = spec.integration_time_micros_limits #BIGGER RANGE THAN REALLY EXISTS; this is available if needed;reads as tuple
         self.max_intensity = spec.max_intensity  #fullscale limit
         self.timelimit = 5 # time in SECONDS, default to 5 s for convenience
+        self.atomwindow = 4 # seconds of full spectra saved at the end of the time series
+        self.writer = BackgroundWriter()  # writes the spectra while the next run is recorded
+        self.writer.start()
         
         #preload wavelength values
         self.wavelength1 = tk.StringVar(self, self.wavelengths[int(len(self.wavelengths) * 0.8)])
@@ -174,6 +189,13 @@ class App(tk.Frame):
         self.timelimitentry.grid(column=1, row=10)
         self.timelimitentry.insert(0, self.timelimit)
         self.timelimitentry.bind('<Return>', self.TimeLimit_change) and self.timelimitentry.bind('<Tab>', self.TimeLimit_change)
+        # Atomization window (full spectra saved)
+        self.atomwindowlabel = tk.Label(self.menu_left_upper, text='Atomization \rwindow (s)', relief = 'ridge')
+        self.atomwindowlabel.grid(column=0, row=11)
+        self.atomwindowentry = tk.Entry(self.menu_left_upper, width = 7)
+        self.atomwindowentry.grid(column=1, row=11)
+        self.atomwindowentry.insert(0, self.atomwindow)
+        self.atomwindowentry.bind('<Return>', self.AtomWindow_change) and self.atomwindowentry.bind('<Tab>', self.AtomWindow_change)
                 
         #lower menu (use Grid placement)
         self.PSscroll = Scrollbar(self.menu_left_lower)
@@ -284,8 +306,10 @@ class App(tk.Frame):
             xdata = []
             linedata = []
             self.linedata.set_data(xdata, linedata)
-            # alldata will be 4 seconds for atomization window and full spectrum width
-            alldata = np.ndarray(shape=(4 * int(1000/self.IntTime*1000) + 2, len(spec.wavelengths())), dtype=float)
+            # full spectra of the atomization window go straight to a capture file on disk
+            atomwindow = min(self.atomwindow, self.timelimit)
+            capture = "capture_" + time.strftime("%Y%m%d_%H%M%S")
+            alldata = SpectrumStream(capture, get_wavelengths(), {"model": spec.model, "IntTime_us": self.IntTime})
 
             self.canvas.draw() # this draw and the lines above blank the display area before a repeat cycle
             index1 = np.where(self.wavelengths == float(self.wavelength1))[0]  #array index of the chosen wavelength
@@ -293,7 +317,7 @@ class App(tk.Frame):
 
             # Need to count down all but the atomization step
             #time.sleep(self.timelimit - 4)
-            for ttt in range((self.timelimit - 4) * int(1000/self.IntTime*1000)):  # show linedata while waiting
+            for ttt in range(int((self.timelimit - atomwindow) * 1000000/self.IntTime)):  # show linedata while waiting
                 ydata = np.array(get_intensities()) # gets full data
                 xdata.append(perf_counter() - starttime) # appends elapsed time on each cycle
                 linedata.append(np.ndarray.item(ydata[index1]))  ### NEW scalar extraction conforms to Numpy > 1.25
@@ -302,10 +326,10 @@ class App(tk.Frame):
 
             #xdata = []
             #self.canvas.draw()
-            for zzz in range(4 * int(1000/self.IntTime*1000) + 2):  # 1 extra cycles to catch end of process
+            for zzz in range(int(atomwindow * 1000000/self.IntTime) + 2):  # 1 extra cycles to catch end of process
                 ydata = np.array(get_intensities()) # gets full data
                 xdata.append(perf_counter() - starttime) # appends elapsed time on each cycle
-                alldata[zzz] = ydata #np.array(get_intensities())  # use the loop increment number for array index
+                alldata.append(xdata[-1], ydata)  # written to the capture file, not kept in RAM
                 linedata.append(np.ndarray.item(ydata[index1]))  ### NEW scalar extraction conforms to Numpy > 1.25
                 self.linedata.set_data(xdata, linedata)  # update matplotlib line data
                 
@@ -322,11 +346,28 @@ class App(tk.Frame):
             #fig2.canvas.manager.show()
         #end diagnostics -----
             self.btn.config(text='Start')
+            alldata.close()
             gc.collect()  # garbage collector
         # save data
-            xdata=np.asarray(xdata)
-            atomization_time = (self.timelimit - 4) * int(1000/self.IntTime*1000)  # as an integer index value
-            saveFile(xdata, alldata, atomization_time)
+            saving = saveFile(alldata, self.IntTime, self.writer)
+            if saving is not None:
+                self.watch_save(saving)
+
+    def watch_save(self, future):
+        # progress of a background save in the title bar, then the result in the PS text
+        if not future.done():
+            status = self.writer.status()
+            self.master.wm_title("Tungsten ETA Data Collection" + (" - " + status if status else ""))
+            self.after(250, self.watch_save, future)
+            return
+        self.master.wm_title("Tungsten ETA Data Collection")
+        try:
+            paths = future.result()
+        except Exception as e:
+            messagebox.showerror("Save failed", str(e))
+            return
+        self.PStext.insert(tk.END, "saved " + os.path.basename(paths[0]) + " \n")
+        self.PStext.see(tk.END)
 
     def wavelenaction(self):
         self.wavelength1 = self.wavelen1box.get()
@@ -509,6 +550,17 @@ class App(tk.Frame):
         if self.DisplayCode == 0:
             self.ax1.set_xlim(-1, self.timelimit*1.05)
             self.canvas.draw()
+    def AtomWindow_change(self, event):
+        atomwindowtemp = self.atomwindowentry.get()
+        try:
+            atomwindowtemp = float(atomwindowtemp)
+            if atomwindowtemp > 0 and atomwindowtemp <= self.timelimit:
+                self.atomwindow = atomwindowtemp
+        except ValueError:  #non numerical entry handler
+            pass
+        self.atomwindowentry.delete(0, 'end')
+        self.atomwindowentry.insert(0, self.atomwindow) # new value or original one back in the box
+
 ## start addition for dynamic Serial selection
     def Connect_PS(self, event):
         if(ser.isOpen() == False):  # check if serial port is open
@@ -663,22 +715,45 @@ class BlitManager:
         # let the GUI event loop process anything it has to do
         cv.flush_events()
 
-def saveFile(data_time, alldata, atom_time):
-    filenameforWriting = asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("All files", "*.*")])
-    if not filenameforWriting:
-        pass  #exits on Cancel
+def saveFile(alldata, IntTime, writer=None):
+    # alldata is the closed SpectrumStream of the atomization window
+    # writer: a BackgroundWriter to do the writing; returns its Future, or None if nothing was queued
+    filenameforWriting = asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("ETA run (binary)", "*.npz"),("All files", "*.*")])
+    if not filenameforWriting:  # Cancel
+        if messagebox.askyesno("Not saved", "Keep the spectra of this run in " + os.path.abspath(alldata.base) + ".spectra?"):
+            return None  # read back with ETAacquisition.read_spectrum_stream
+        alldata.delete()
+        return None
+    if writer is None:
+        writeSpectra(alldata, filenameforWriting, IntTime)
+        return None
+    return writer.submit(os.path.basename(filenameforWriting), writeSpectra, alldata, filenameforWriting, IntTime, writer)
+
+def writeSpectra(alldata, filenameforWriting, IntTime, writer=None):
+    # runs on the writer thread: wavelengths and model come from the capture, not from spec,
+    # which the next run is using; the capture is deleted once written; returns the paths written
+    wavelengths = np.array(alldata.info["wavelengths"])
+    specmodel = alldata.info["model"]
+    if os.path.splitext(filenameforWriting)[1].lower() == ".npz":
+        written = save_run(filenameforWriting, alldata.times(), alldata.spectra(), wavelengths, specmodel, "# Spectral data", IntTime=IntTime)
     else:
         path_ext = os.path.splitext(filenameforWriting)
         allfile = str(path_ext[0] + "all" + path_ext[1])
-        specmodel = spec.model
         allheader = "# Spectrometer = " + specmodel + "\n# Spectral data "
-        # get wavelengths (columns) and time (rows) values to append to Counts matrix
-        wavelengths = get_wavelengths()
-        alldata = np.row_stack((wavelengths, alldata))
-        data_time = data_time[atom_time :]  # from time - 4 to end as an integer index
-        data_time = np.insert(data_time, 0, 0)
-        alldata = np.column_stack((data_time, alldata))
-        np.savetxt(allfile, alldata, delimiter=',', newline='\n', header=allheader, comments='')
+        # wavelengths (columns) and time (rows) around the Counts matrix, written in blocks of rows
+        with open(allfile, 'w') as f:
+            f.write(allheader + '\n')
+            np.savetxt(f, [np.insert(wavelengths, 0, 0)], delimiter=',', newline='\n')
+            data_time = alldata.times()
+            spectra = alldata.spectra()
+            for start in range(0, alldata.count, 500):
+                block = np.column_stack((data_time[start:start+500], spectra[start:start+500]))
+                np.savetxt(f, block, delimiter=',', newline='\n')
+                if writer is not None:
+                    writer.report((start + len(block)) / alldata.count)
+        written = [allfile]
+    alldata.delete()  # not reached if writing failed, so the spectra are still on disk then
+    return written
 
 
 def processData():
@@ -693,6 +768,9 @@ def main():
     app = App(root)
     app.pack()
     root.mainloop()
+    if app.writer.pending():
+        print("Waiting for", app.writer.pending(), "saves to finish")
+    app.writer.close()  # queued spectra are written before the program ends
 
 if __name__ == '__main__':
     main()
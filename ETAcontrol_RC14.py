@@ -1,3 +1,6 @@
+from time import (perf_counter)
+STARTED = perf_counter()  # startup times are reported from here
+
 # Functional on all parts.
 #
 # With 3 lines showing in real time, minimum IntTime is 25ms due to extra drawing overhead
@@ -13,6 +16,50 @@
 #   a pixel marker using 'markevery=2' for everyother point.
 ## 03/2023 put dynamic COM port selector to avoid hard coding.
 ## 02/2024 updated scalar extraction to comply with Numpy > 1.25 standards
+## 10/2026 spectrometer is read on its own thread during a time series (ETAacquisition.py).
+#  The Tk loop drains the frames and redraws at its own pace, so drawing no longer costs samples.
+## 10/2026 time series kept in a preallocated array store (TimeSeriesBuffer) instead of lists
+#  that grew every frame; the per-frame cost no longer depends on run length.
+## 10/2026 run length is a perf_counter deadline; late frames and jitter are written in the file header.
+## 10/2026 ETA_SIMULATE=synthetic (or =testdata.zip) runs with the simulated spectrometer in ETAsimulator.py
+## 10/2026 a port name typed in the COM port box (Enter) is accepted, e.g. the PSemulator.py pty
+## 10/2026 number of live traces is App.ntraces (line, bkg, base) so ETAbenchmark.py can vary it
+## 10/2026 live time series shows a min/max envelope with one bin per pixel column (MinMaxDecimator)
+#  instead of markevery; drawing cost per frame no longer grows with run length and peaks are kept.
+## 10/2026 display refresh capped at 'Display rate (Hz)' (10-60) in both modes; frames that arrive
+#  between two paints are drawn together, the spectrum shows the newest one.
+## 10/2026 spectrum mode is no longer a busy loop: a preview thread reads continuously and the Tk loop
+#  draws its newest frame at the display rate, so buttons stay responsive and a CPU core is freed.
+## 10/2026 saving with a .npz extension writes one binary run file (counts, times, wavelengths,
+#  integration time, model, slot, diagnostics) instead of three text files; ReadNProcess9 reads both.
+## 10/2026 'Extra channels (nm)' adds monitored pixels or summed bands (e.g. 357.9, 425.3-425.7) to the
+#  time series after line, bkg and base; all channels are taken from a frame in one gather (ChannelMap).
+## 10/2026 'Pre-trigger (s)': in time series mode the spectrometer is read continuously into a ring of
+#  that length; Measure (or Start) triggers the run and the saved data begins before time zero.
+## 10/2026 serial port is used only from a SerialWorker thread; commands return futures that the Tk loop
+#  polls (when_done), so connecting, sending and Measure never wait for the power supply.
+## 10/2026 time the start command left the port is saved as an event marker ("# Event start R n at (s) =")
+#  on the run time axis; ReadNProcess9 can zero the time axis on it.
+## 10/2026 faster startup: the window appears first and shows progress while Matplotlib is imported and
+#  the spectrometer is opened on a thread (discover_hardware); pyplot is not imported at all.  Wavelength
+#  boxes step through the pixel array (wavelen_step) instead of holding every wavelength as a Spinbox
+#  value, and COM ports are listed when the box is opened.  Window and ready times are printed and shown
+#  in the PS text box; aim is the window within 1 s and ready within 5 s of launch on a Pi 3B.
+## 10/2026 'Co-add frames' and 'Boxcar (pixels)' average the time series frames and smooth across pixels
+#  before the channels are taken (FrameAverager); the saved times are those of the averaged frames.
+## 10/2026 dark pixel and nonlinearity corrections applied in NumPy with the spectrometer's coefficients
+#  read once at startup (FrameCorrector), and an optional stored dark frame ('Store dark').  Raw frames
+#  are still read with seabreeze's corrections off; the corrections in use go into the file header.
+## 10/2026 'Profile stages' times the USB read, frame processing, set_data, the blit steps and GC pauses
+#  (StageProfiler); 'Save profile' writes a Chrome trace (.json) and a per-stage histogram (_summary.txt).
+## 10/2026 cyclic GC is frozen and disabled for each time series (GCGuard) instead of only collected before
+#  and after; collections during the run and the one after it are timed in the file header.
+## 10/2026 'Run sequence' fires replicates of the current settings, or each method of a CSV file (see
+#  read_methods), saving every run under an automatic name with no dialog and waiting 'Cool-down (s)'
+#  between firings.  The spectrometer keeps reading during the cool-down.  'Stop PS' ends the sequence.
+## 10/2026 runs are written by a background thread (BackgroundWriter), so Measure is available again as
+#  soon as the file name is chosen; progress is in the title bar and each finished save in the PS text.
+#  Closing the window waits for saves still queued.
 
 try:
     import Tkinter as tk
@@ -23,35 +70,53 @@ from tkinter import Spinbox
 from tkinter import Text
 from tkinter import messagebox
 from tkinter.filedialog import asksaveasfilename
+from tkinter.filedialog import askopenfilename
+from tkinter import simpledialog
 import tkinter.ttk as ttk  #necessary for combo box in Serial selection
 
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from matplotlib import pyplot as plt
-from matplotlib.lines import Line2D
-from matplotlib import style
-style.use("ggplot")
-plt.rcParams['axes.facecolor']='#F8F8F8'
-plt.rcParams['lines.color']='blue'
-plt.rcParams['figure.figsize'] = [9.0, 7.0]
-
-import seabreeze.spectrometers as sb
 import numpy as np
 
-import time
-from time import (perf_counter)
 import os #for filename and path handling
 import csv  #easier file writing
 import gc  #garbage collection
+import threading
 import serial
 import serial.tools.list_ports
 
+from ETAacquisition import AcquisitionThread, TimeSeriesBuffer, MinMaxDecimator, run_capacity, timing_summary, timing_header, write_timeseries, save_run, ChannelMap, channel_names, SerialWorker, events_header, FrameAverager, FrameCorrector, StageProfiler, GCGuard, read_methods, RunSequence, BackgroundWriter
+
 # Enumerate spectrometer, set a default integration time, get x & y extents
-try:
-    spec = sb.Spectrometer.from_serial_number()
-except:
-    messagebox.showerror("Error", "No spectrometer attached")
-    exit()
+spec = None  # set by open_spectrometer
+def open_spectrometer():
+    global spec
+    if os.environ.get("ETA_SIMULATE"):  # no hardware: replay a saved run or a synthetic firing
+        from ETAsimulator import SimulatedSpectrometer
+        spec = SimulatedSpectrometer.from_source(os.environ["ETA_SIMULATE"])
+    else:
+        import seabreeze.spectrometers as sb  # slow import, done here so the window is already up
+        spec = sb.Spectrometer.from_serial_number()
+    return spec
+
+def plot_style():
+    # Matplotlib is imported when the plot is built, not before the window exists
+    import matplotlib
+    from matplotlib import style
+    style.use("ggplot")
+    matplotlib.rcParams['axes.facecolor']='#F8F8F8'
+    matplotlib.rcParams['lines.color']='blue'
+    matplotlib.rcParams['figure.figsize'] = [9.0, 7.0]
+
+startup = {"status": "Starting", "error": None}  # progress of discover_hardware
+def discover_hardware():
+    # runs on a thread while the Tk window shows startup["status"]
+    try:
+        startup["status"] = "Loading plotting library..."
+        import matplotlib.backends.backend_tkagg  # the slow part of building the plot, overlaps the USB search
+        startup["status"] = "Looking for the spectrometer..."
+        open_spectrometer()
+        startup["status"] = "Found " + spec.model
+    except Exception as e:
+        startup["error"] = e
 #Serial port setup
 try:
     ser = serial.Serial(port=None, #'COM3',
@@ -71,17 +136,26 @@ except:
     exit()
 
 # Spectrometer data collectors
+spec_lock = threading.Lock()  # the acquisition thread and the GUI both talk to spec
+profiler = StageProfiler()  # off until 'Profile stages' is ticked
 def get_wavelengths():
     spec_x = spec.wavelengths()
     return spec_x
 def get_intensities():
-    spec_y = spec.intensities(correct_dark_counts=False, correct_nonlinearity=False) #dark counts might need to be false
+    with spec_lock:
+        start = perf_counter()
+        spec_y = spec.intensities(correct_dark_counts=False, correct_nonlinearity=False) #dark counts might need to be false
+    if profiler.enabled:
+        profiler.record("usb read", start)
     return spec_y
 
 class App(tk.Frame):
     def __init__(self, master=None, **kwargs):
 
         tk.Frame.__init__(self, master, **kwargs)
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        plot_style()
 #Spectrometer initial setup
         self.wavelengths = np.around(get_wavelengths(), decimals=3) #round wavelengths to practical limits
         self.ydata = np.array(get_intensities())
@@ -98,6 +172,27 @@ class App(tk.Frame):
         self.IntTimeLimits = spec.integration_time_micros_limits #BIGGER RANGE THAN REALLY EXISTS; this is available if needed;reads as tuple
         self.max_intensity = spec.max_intensity  #fullscale limit
         self.timelimit = 5 # time in SECONDS, default to 5 s for convenience
+        self.worker = None  # AcquisitionThread of the current time series
+        self.draining = False  # True while a time series is being drawn and stored
+        self.serial = SerialWorker(ser)  # all power supply I/O, off the Tk thread
+        self.serial.start()
+        self.writer = BackgroundWriter()  # saves runs while the next one is recorded
+        self.writer.start()
+        self.gocommand = None  # Future of the last start command sent by PS_go
+        self.pretrigger = 0 # seconds kept from before the trigger, 0 is off
+        self.averager = FrameAverager(len(self.wavelengths))  # co-add and boxcar of time series frames, off
+        self.corrector = FrameCorrector.from_spectrometer(spec)  # coefficients read once, corrections off
+        self.darkframes = 20  # frames averaged by 'Store dark'
+        self.darkworker = None  # AcquisitionThread reading them, see collect_dark
+        self.darkread = []  # frames collected so far
+        self.sequence = None  # RunSequence being fired
+        self.sequence_after = None  # Tk 'after' id of the next firing
+        self.cooldown = 60  # seconds between firings of a sequence
+        self.warm = None  # AcquisitionThread reading between the firings of a sequence
+        self.preview = None  # AcquisitionThread of the spectrum display
+        self.gcguard = GCGuard()  # started for each time series
+        self.DisplayRate = 30  # Hz, redraws per second in both display modes
+        self.DisplayInterval = int(1000 / self.DisplayRate)  # ms between redraws
         
         #preload wavelength values
         self.wavelength1 = tk.StringVar(self, self.wavelengths[int(len(self.wavelengths) * 0.8)])
@@ -119,19 +214,20 @@ class App(tk.Frame):
         #upper menu (use Grid placement)
         self.wavelen1boxlabel = tk.Label(self.menu_left_upper, text='Line Wavelength 1:', fg = 'red', relief = 'ridge')
         self.wavelen1boxlabel.grid(column=0, row=1)
-        self.wavelen1box = Spinbox(self.menu_left_upper, values = list(self.wavelengths), textvariable=self.wavelength1, width=7, format="%.3f", command=self.wavelenaction)# only valid wavelengths displayed
+        wavelen_step = (self.register(self.wavelen_step), '%W', '%d')  # arrows move one pixel, see wavelen_step
+        self.wavelen1box = Spinbox(self.menu_left_upper, from_=self.xmin, to=self.xmax, increment=self.waveres, textvariable=self.wavelength1, width=7, format="%.3f", command=wavelen_step)# only valid wavelengths displayed
         self.wavelength1.set(self.wavelengths[int(len(self.wavelengths) * 0.8)]) # using values list sets first index as default, this 'set' inserts preferred initial value; (int(len()) gets index position
         self.wavelen1box.bind('<Return>', self.wavelen_entry) and self.wavelen1box.bind('<Tab>', self.wavelen_entry)
         self.wavelen1box.grid(column=1, row=1)
         self.wavelen2boxlabel = tk.Label(self.menu_left_upper, text=' Bkg Wavelength 2:', fg = 'green', relief = 'ridge')
         self.wavelen2boxlabel.grid(column=0, row=2)
-        self.wavelen2box = Spinbox(self.menu_left_upper, values = list(self.wavelengths), textvariable=self.wavelength2, width=7, format="%.3f", command=self.wavelenaction)# only valid wavelengths displayed
+        self.wavelen2box = Spinbox(self.menu_left_upper, from_=self.xmin, to=self.xmax, increment=self.waveres, textvariable=self.wavelength2, width=7, format="%.3f", command=wavelen_step)# only valid wavelengths displayed
         self.wavelength2.set(self.wavelengths[int(len(self.wavelengths) * 0.7)])
         self.wavelen2box.bind('<Return>', self.wavelen_entry) and self.wavelen2box.bind('<Tab>', self.wavelen_entry)
         self.wavelen2box.grid(column=1, row=2)
         self.wavelen3boxlabel = tk.Label(self.menu_left_upper, text='Base Wavelength 3:', fg = 'purple', relief = 'ridge')
         self.wavelen3boxlabel.grid(column=0, row=3)
-        self.wavelen3box = Spinbox(self.menu_left_upper, values = list(self.wavelengths), textvariable=self.wavelength3, width=7, format="%.3f", command=self.wavelenaction)# only valid wavelengths displayed
+        self.wavelen3box = Spinbox(self.menu_left_upper, from_=self.xmin, to=self.xmax, increment=self.waveres, textvariable=self.wavelength3, width=7, format="%.3f", command=wavelen_step)# only valid wavelengths displayed
         self.wavelength3.set(self.wavelengths[int(len(self.wavelengths) * 0.6)])
         self.wavelen3box.bind('<Return>', self.wavelen_entry) and self.wavelen3box.bind('<Tab>', self.wavelen_entry)
         self.wavelen3box.grid(column=1, row=3)
@@ -182,6 +278,61 @@ class App(tk.Frame):
         self.timelimitentry.grid(column=1, row=10)
         self.timelimitentry.insert(0, self.timelimit)
         self.timelimitentry.bind('<Return>', self.TimeLimit_change) and self.timelimitentry.bind('<Tab>', self.TimeLimit_change)
+        # Display refresh rate
+        self.displayratelabel = tk.Label(self.menu_left_upper, text='Display rate \r(Hz)', relief = 'ridge')
+        self.displayratelabel.grid(column=0, row=11)
+        self.displayrateentry = tk.Entry(self.menu_left_upper, width = 7)
+        self.displayrateentry.grid(column=1, row=11)
+        self.displayrateentry.insert(0, self.DisplayRate)
+        self.displayrateentry.bind('<Return>', self.DisplayRate_change) and self.displayrateentry.bind('<Tab>', self.DisplayRate_change)
+        # Further monitored channels, recorded but not drawn
+        self.extrachannels = []  # text of each channel, see ChannelMap
+        self.extrachannelslabel = tk.Label(self.menu_left_upper, text='Extra channels \r(nm)', relief = 'ridge')
+        self.extrachannelslabel.grid(column=0, row=12)
+        self.extrachannelsentry = tk.Entry(self.menu_left_upper, width = 14)
+        self.extrachannelsentry.grid(column=1, row=12)
+        self.extrachannelsentry.bind('<Return>', self.ExtraChannels_change) and self.extrachannelsentry.bind('<Tab>', self.ExtraChannels_change)
+        # Pre-trigger length
+        self.pretriggerlabel = tk.Label(self.menu_left_upper, text='Pre-trigger (s)', relief = 'ridge')
+        self.pretriggerlabel.grid(column=0, row=13)
+        self.pretriggerentry = tk.Entry(self.menu_left_upper, width = 7)
+        self.pretriggerentry.grid(column=1, row=13)
+        self.pretriggerentry.insert(0, self.pretrigger)
+        self.pretriggerentry.bind('<Return>', self.PreTrigger_change) and self.pretriggerentry.bind('<Tab>', self.PreTrigger_change)
+        # Averaging of time series frames
+        self.coaddlabel = tk.Label(self.menu_left_upper, text='Co-add frames', relief = 'ridge')
+        self.coaddlabel.grid(column=0, row=14)
+        self.coaddentry = tk.Entry(self.menu_left_upper, width = 7)
+        self.coaddentry.grid(column=1, row=14)
+        self.coaddentry.insert(0, self.averager.coadd)
+        self.coaddentry.bind('<Return>', self.Averaging_change) and self.coaddentry.bind('<Tab>', self.Averaging_change)
+        self.boxcarlabel = tk.Label(self.menu_left_upper, text='Boxcar (pixels)', relief = 'ridge')
+        self.boxcarlabel.grid(column=0, row=15)
+        self.boxcarentry = tk.Entry(self.menu_left_upper, width = 7)
+        self.boxcarentry.grid(column=1, row=15)
+        self.boxcarentry.insert(0, self.averager.boxcar)
+        self.boxcarentry.bind('<Return>', self.Averaging_change) and self.boxcarentry.bind('<Tab>', self.Averaging_change)
+        # Dark and nonlinearity corrections
+        self.darkcorr_on = tk.IntVar(self, 0)
+        self.darkcorr_check = tk.Checkbutton(self.menu_left_upper, text='Dark pixel corr.', variable=self.darkcorr_on, command=self.Corrections_change)
+        self.darkcorr_check.grid(column=0, row=16)
+        self.nonlincorr_on = tk.IntVar(self, 0)
+        self.nonlincorr_check = tk.Checkbutton(self.menu_left_upper, text='Nonlinearity corr.', variable=self.nonlincorr_on, command=self.Corrections_change)
+        self.nonlincorr_check.grid(column=1, row=16)
+        if not self.corrector.dark_pixels.size:
+            self.darkcorr_check.config(state='disabled')  # spectrometer has no electric dark pixels
+        if not self.corrector.nonlinearity.size:
+            self.nonlincorr_check.config(state='disabled')
+        self.button_darkframe = tk.Button(self.menu_left_upper, text='Store dark')
+        self.button_darkframe.grid(column=0, row=17)
+        self.button_darkframe.bind('<ButtonRelease-1>', self.DarkFrame)
+        # Stage profiling
+        self.profile_on = tk.IntVar(self, 0)
+        self.profile_check = tk.Checkbutton(self.menu_left_upper, text='Profile stages', variable=self.profile_on, command=self.Profile_change)
+        self.profile_check.grid(column=0, row=18)
+        self.button_saveprofile = tk.Button(self.menu_left_upper, text='Save profile')
+        self.button_saveprofile.grid(column=1, row=18)
+        self.button_saveprofile.bind('<ButtonRelease-1>', self.SaveProfile)
                 
         #lower menu (use Grid placement)
         self.PSscroll = Scrollbar(self.menu_left_lower)
@@ -215,9 +366,20 @@ class App(tk.Frame):
         
         tk.Label(self.menu_left_lower, text = "COM port", relief = 'sunken').grid(column=0, row=7)
         #tk.Label(text = CommPort, relief = 'groove').grid(column=1, row=11) #use the getComm function below in the Connect/Disconnect function)
-        self.ports_box = ttk.Combobox(self.menu_left_lower, values = scanSerial())
+        self.ports_box = ttk.Combobox(self.menu_left_lower, values = [], postcommand=self.list_ports)  # scanned when opened
         self.ports_box.grid(column = 0, row = 8)
         self.ports_box.bind('<<ComboboxSelected>>', self.on_selectComm)
+        self.ports_box.bind('<Return>', self.on_selectComm)  # typed ports are not listed by scanSerial, e.g. /dev/pts/4
+        # Unattended sequence of firings
+        self.cooldownlabel = tk.Label(self.menu_left_lower, text='Cool-down (s)', relief = 'ridge')
+        self.cooldownlabel.grid(column=0, row=9)
+        self.cooldownentry = tk.Entry(self.menu_left_lower, width = 7)
+        self.cooldownentry.grid(column=1, row=9)
+        self.cooldownentry.insert(0, self.cooldown)
+        self.cooldownentry.bind('<Return>', self.Cooldown_change) and self.cooldownentry.bind('<Tab>', self.Cooldown_change)
+        self.button_sequence = tk.Button(self.menu_left_lower, text='Run sequence')
+        self.button_sequence.grid(column=0, row=10)
+        self.button_sequence.bind('<ButtonRelease-1>', self.RunSequence_click)
 
         # right display area -- Spectrograph Plot Area
         self.some_title_frame = tk.Frame(self, bg="#dfdfdf")
@@ -246,7 +408,7 @@ class App(tk.Frame):
 #Create plot area
         #create plot object and draw it with empty data before starting matplotlib line artists
         # 'ax1' is ax"one" not a letter
-        self.fig = plt.Figure()
+        self.fig = Figure()
         self.ax1 = self.fig.add_subplot(111)
         self.line, = self.ax1.plot([], [], lw=1, color='blue') #creates empty line !! comma is important for Blit
         self.canvas = FigureCanvasTkAgg(self.fig, master=self)
@@ -262,14 +424,20 @@ class App(tk.Frame):
         self.waveline1, = self.ax1.plot([], [], lw=2, color='red', alpha = 0.5)  #create empty objects because these lines are Blit artists
         self.waveline2, = self.ax1.plot([], [], lw=2, color='green', alpha = 0.5)
         self.waveline3, = self.ax1.plot([], [], lw=2, color='purple', alpha = 0.5)
-        self.linedata, = self.ax1.plot([], [], '.', color='red', markevery=5)
-        self.bkgdata, = self.ax1.plot([], [], '.', color='green', markevery=5)
-        #self.basedata, = self.ax1.plot([], [], '.', color='purple', markevery=5)  #not usually displayed
+        self.linedata, = self.ax1.plot([], [], '.', color='red')  # decimated to the axes width, markevery not needed
+        self.bkgdata, = self.ax1.plot([], [], '.', color='green')
+        self.basedata, = self.ax1.plot([], [], '.', color='purple')  #not usually displayed
+        self.traces = [self.linedata, self.bkgdata, self.basedata]  # same order as the channels of the run
+        self.ntraces = 2  # base data is calculated but not drawn to save on drawing overhead and gain speed
         self.bm = BlitManager(self.fig.canvas, [self.line, self.waveline1, self.waveline2, self.waveline3]) #remember to send all lines to the Class !! set bm because the first screen is always a spectrum
 #end artist creation
 
     def on_click(self):
         # Start button will start infinite cycle on whole spectrum or start an individual time series.
+        if self.draining or self.sequence is not None or self.darkworker is not None:
+            return  # wait for the time series, the sequence or 'Store dark' to finish
+        if self.preview is not None and self.preview.is_alive():
+            return  # spectrum already running
         gc.collect()
         self.bm = BlitManager(self.fig.canvas, [self.line, self.waveline1, self.waveline2, self.waveline3]) #reset blit to spectrum mode
         self.btn.config(text='Running')
@@ -279,54 +447,162 @@ class App(tk.Frame):
         # if DisplayCode = 1 then do spectrum;  else do timeseries as below
         self.canvas.draw()  # guarantees that all lines and scaling get reset
         
-        while self.DisplayCode == 1:
-            self.line.set_data(self.wavelengths, get_intensities()) # update matplotlib line data
-            self.bm.update()  #redraw with blit manager call
+        if self.DisplayCode == 1:
+            # continuous spectrum; the thread keeps only the newest frame for show_spectrum
+            self.disarm()
+            self.preview = AcquisitionThread(get_intensities, None, self.IntTime / 1000000, latest_only=True)
+            self.preview.start()
+            self.shown = 0
+            self.after(self.DisplayInterval, self.show_spectrum)
  
         else:
-            self.bm = BlitManager(self.fig.canvas, [self.linedata, self.bkgdata])#, self.basedata])
-            gc.collect()
-            xdata = []
-            linedata = []
-            bkgdata = []
-            basedata = []  # base data is calculated but not drawn to save on drawing overhead and gain speed
-            self.linedata.set_data(xdata, linedata)
-            self.bkgdata.set_data(xdata, bkgdata)
-            #self.basedata.set_data(xdata, basedata)  #not usually displayed
+            if self.draining:
+                return  # a time series is already being recorded
+            self.stop_preview()
+            self.bm = BlitManager(self.fig.canvas, self.traces[:self.ntraces])
+            if not self.gcguard.running:  # PS_go starts it before the trigger
+                self.gcguard = GCGuard()  # collects now, then no automatic collection until finish_timeseries
+                self.gcguard.start()
+            # line, bkg and base in rows 0, 1, 2, then the extra channels
+            self.channels = ChannelMap(self.wavelengths, [self.wavelength1, self.wavelength2, self.wavelength3] + self.extrachannels)
+            self.run = TimeSeriesBuffer(run_capacity(self.timelimit + self.pretrigger, self.IntTime), len(self.channels))
+            self.averager.reset()
+            xmin, xmax = self.ax1.get_xlim()
+            self.decimator = MinMaxDecimator(xmin, xmax, self.ax1.bbox.width, 3)  # display only; the run keeps every frame
+            for i, trace in enumerate(self.traces):
+                trace.set_data(self.decimator.xdata(), self.decimator.ydata(i))
             self.canvas.draw() # this draw and the lines above blank the display area before a repeat cycle
-            index1 = np.where(self.wavelengths == float(self.wavelength1))[0]  #array index of the chosen wavelength
-            index2 = np.where(self.wavelengths == float(self.wavelength2))[0]
-            index3 = np.where(self.wavelengths == float(self.wavelength3))[0]
-            starttime = perf_counter()  # better quality time counter
-            for zzz in range(self.timelimit * int(1000/self.IntTime*1000) + 2):  # 2 extra cycles to catch end of process
-                ydata = np.array(get_intensities()) # gets full data
-                xdata.append(perf_counter() - starttime) # appends elapsed time on each cycle
-                linedata.append(np.ndarray.item(ydata[index1]))  ### NEW scalar extraction conforms to Numpy > 1.25
-                bkgdata.append(np.ndarray.item(ydata[index2]))  # deprecated use of float to get a scalar
-                basedata.append(np.ndarray.item(ydata[index3]))
-                self.linedata.set_data(xdata, linedata)  # update matplotlib line data
-                self.bkgdata.set_data(xdata, bkgdata)
-                #self.basedata.set_data(xdata, basedata)  # not usually displayed
-                self.bm.update()  # blit manager call
-        #diagnostics printed to terminal, can be removed ----
-            #print("per point = ", str((perf_counter()-starttime)/(self.timelimit * int(1000/self.IntTime*1000))))
-            #print("std dev = ", str(np.std(np.diff(xdata))))
-            #print("max = ", str(np.amax(np.diff(xdata))))
-            #print("# over inttime = ", sum(i>(1.05*self.IntTime/1000000) for i in np.diff(xdata)))
-            #print(np.where(np.asarray(xdata)>(self.IntTime/1000)))
-            #print(np.diff(xdata))
-            #fig2, ax2 = plt.subplots()
-            #ax2.plot(xdata[0:len(xdata)-1], np.diff(xdata), 'o')
-            #fig2.canvas.manager.show()
-        #end diagnostics -----
+            # the worker owns the spectrometer for the run; it keeps its own time zero (perf_counter)
+            if self.worker is not None and self.worker.pretrigger and self.worker.is_alive():
+                self.worker.duration = self.timelimit
+                if self.worker.armed:  # PS_go triggers before sending the start command
+                    self.worker.trigger()
+            else:
+                self.worker = AcquisitionThread(get_intensities, self.timelimit, self.IntTime / 1000000)
+                self.worker.start()
+            self.draining = True
+            self.after(self.DisplayInterval, self.drain_frames)
+
+    def arm(self):
+        # time series mode with a pre-trigger: read continuously and wait for Measure or Start
+        if self.pretrigger <= 0 or self.DisplayCode != 0 or self.draining or self.preview is not None:
+            return
+        if self.worker is not None and self.worker.armed:
+            return  # already waiting
+        self.worker = AcquisitionThread(get_intensities, self.timelimit, self.IntTime / 1000000, pretrigger=self.pretrigger)
+        self.worker.start()
+
+    def disarm(self):
+        if self.worker is not None and self.worker.armed:
+            self.worker.stop()
+            self.worker = None
+
+    def show_spectrum(self):
+        # called from the Tk loop at the display rate; frames in between are skipped
+        if self.preview is None:
+            return  # stopped by a time series
+        if self.DisplayCode != 1:  # mode switched while the spectrum was running
+            self.stop_preview()
+            return self.update_graph()  # start the time series, as the old spectrum loop did
+        if self.preview.error is not None:
+            self.PStext.insert(tk.END, "spectrometer read failed: " + str(self.preview.error) + " \n")
+            self.PStext.see(tk.END)
+            self.preview = None
             self.btn.config(text='Start')
-            gc.collect()  # garbage collector
+            return
+        if self.preview.count != self.shown:
+            self.shown = self.preview.count
+            ydata = self.preview.latest[1]
+            if self.corrector.active:
+                ydata = self.corrector.correct(ydata).copy()  # the line keeps its data
+            self.line.set_data(self.wavelengths, ydata) # update matplotlib line data
+            self.bm.update(flush=False)  #redraw with blit manager call
+        self.after(self.DisplayInterval, self.show_spectrum)
+
+    def stop_preview(self):
+        if self.preview is not None:
+            self.preview.stop()  # spec_lock keeps its last read from overlapping the next user of spec
+            self.preview = None
+
+    def drain_frames(self):
+        # called from the Tk loop; takes every frame that arrived since the last redraw
+        frames = self.worker.get_frames()
+        first = self.run.count
+        start = perf_counter()
+        for frametime, ydata in frames:
+            if self.corrector.active:
+                ydata = self.corrector.correct(ydata)
+            if self.averager.active:
+                averaged = self.averager.add(frametime, ydata)
+                if averaged is None:
+                    continue  # more frames to co-add
+                frametime, ydata = averaged
+            self.run.append(frametime - self.worker.starttime, self.channels.extract(ydata)) # elapsed time of each frame
+        if frames:
+            if profiler.enabled:
+                profiler.record("process frames", start)
+            start = perf_counter()
+            self.decimator.add(*self.run.since(first))  # only the new frames
+            xdata = self.decimator.xdata()  # at most two points per pixel column
+            for i in range(self.ntraces):
+                self.traces[i].set_data(xdata, self.decimator.ydata(i))  # update matplotlib line data
+            if profiler.enabled:
+                profiler.record("set_data", start)
+            self.bm.update(flush=False)  # blit manager call, Tk loop is already running
+        self.gcguard.check()  # young collection only if a long run has allocated a lot
+        if self.worker.running():
+            self.after(self.DisplayInterval, self.drain_frames)
+        else:
+            self.finish_timeseries()
+
+    def finish_timeseries(self):
+        self.gcguard.stop()  # re-enables and collects
+        error = self.worker.error  # kept here: arm() below replaces the worker
+        xdata = self.run.times()
+        timing = timing_summary(xdata, self.worker.period * self.averager.coadd)  # how trustworthy the timebase of this run is
+        diagnostics = timing_header(timing)
+        if error is not None:
+            diagnostics += "\n# Run ended early, spectrometer read failed: " + str(error)
+            self.PStext.insert(tk.END, "spectrometer read failed, run ended early: " + str(error) + " \n")
+        if self.averager.active:
+            diagnostics += "\n# Co-added frames = " + str(self.averager.coadd) + ", boxcar (pixels) = " + str(self.averager.boxcar)
+        diagnostics += "\n# Corrections = " + self.corrector.describe()
+        if self.run.dropped > 0:
+            diagnostics += "\n# Frames not stored (buffer full) = " + str(self.run.dropped)
+        if self.pretrigger > 0:
+            # what the ring held at the trigger: none if Measure came from spectrum mode, less if it was still filling
+            captured = max(-xdata[0], 0.0) if len(xdata) else 0.0
+            diagnostics += ("\n# Pre-trigger (s) = " + str(round(captured, 3)) + " captured of " + str(self.pretrigger)
+                            + " set, time zero at the trigger")
+        diagnostics += "\n" + self.gcguard.describe()
+        events = []
+        if self.gocommand is not None and self.gocommand.done() and self.gocommand.exception() is None:
+            reply = self.gocommand.result()  # sent by PS_go for this run
+            events.append(("start " + reply.command.strip(), reply.sent - self.worker.starttime))
+            diagnostics += "\n" + events_header(events)
+        self.gocommand = None
+        self.draining = False
+        self.PStext.insert(tk.END, str(timing["frames"]) + " frames, " + str(timing["late"]) + " late \n")
+        self.PStext.see(tk.END)
+        self.btn.config(text='Start')
         # save data
-            xdata=np.asarray(xdata)
-            linedata=np.asarray(linedata)
-            bkgdata=np.asarray(bkgdata)
-            basedata=np.asarray(basedata)
-            saveFile(xdata, linedata, bkgdata, basedata, self.wavelength1, self.wavelength2, self.wavelength3)
+        saving = saveFile(xdata, [self.run.channel(i) for i in range(len(self.channels))], self.channels, diagnostics,
+                          {"IntTime": self.IntTime, "slot": self.PS_slot.get(), "events": events,
+                           "missed_per_frame": timing["missed_per_frame"]},
+                          self.sequence.filename if self.sequence is not None else None,  # a sequence names its own files
+                          self.writer)
+        if saving is not None:
+            self.when_done(saving, self.show_saved)
+            self.show_writer()
+        if error is not None:
+            self.stop_sequence("stopped, spectrometer read failed")
+            return  # no new ring or warm reads on a failed spectrometer
+        self.arm()  # ready for the next run
+        if self.sequence is not None:
+            self.PStext.insert(tk.END, "saving " + os.path.basename(self.sequence.filename) + " \n")
+            self.PStext.see(tk.END)
+            self.keep_warm()
+            self.sequence_after = self.after(int(self.sequence.cooldown * 1000), self.next_in_sequence)
 
     def wavelenaction(self):
         self.wavelength1 = self.wavelen1box.get()
@@ -337,6 +613,19 @@ class App(tk.Frame):
         self.waveline3.set_data([float(self.wavelength3), float(self.wavelength3)], [self.ymin, self.ymax])
         self.bm.update()   # update the line locations with self.bm.update()
 
+    def wavelen_step(self, widget, direction):
+        # Spinbox arrows: move to the neighbouring pixel from the last accepted wavelength
+        boxes = [self.wavelen1box, self.wavelen2box, self.wavelen3box]
+        current = [self.wavelength1, self.wavelength2, self.wavelength3]
+        box = self.nametowidget(widget)
+        i = boxes.index(box)
+        index = int(np.searchsorted(self.wavelengths, float(current[i]), side='left'))
+        index = index + 1 if direction == 'up' else index - 1
+        index = min(max(index, 0), len(self.wavelengths) - 1)
+        box.delete(0, 'end')
+        box.insert(0, self.wavelengths[index])
+        self.wavelenaction()
+
     def wavelen_entry(self, event):
         tempwavelen1 = self.wavelen1box.get()
         if self.check_valid_wavelength(tempwavelen1) == True:
@@ -407,13 +696,15 @@ class App(tk.Frame):
             self.DisplayCode = 0
             self.button_DisplayMode.configure(text='Time Series')
             self.ax1.set_ylim(self.ymin*0.8, self.ymax*2)  # generous upper limit for signals
-            self.ax1.set_xlim(-1, self.timelimit*1.05) #testing limits
+            self.ax1.set_xlim(-1 - self.pretrigger, self.timelimit*1.05) #testing limits
             self.ax1.set_xlabel('Time (s)')
             self.ax1.grid(True, color='1', ls='solid')  # places negative space grid on spectrum display
             self.canvas.draw()
+            self.arm()
             # DisplayCode is also in the 'def update_graph()'
         else:
             self.DisplayCode = 1  # handles change to spectrum
+            self.disarm()
             self.button_DisplayMode.configure(text='Spectrum')
             self.ax1.set_ylim(self.ymin*0.8, self.ymax*1.1)
             self.ax1.set_xlim(self.xmin, self.xmax)  # max and min wavelengths from reported (self.xmin, self.xmax)
@@ -464,6 +755,10 @@ class App(tk.Frame):
     def IntegrationTime(self, event):
         #typically OO spectrometers can't read faster than 4 ms
         #and we don't want integration times too long on accident 
+        if self.draining or self.darkworker is not None:  # the running time series (or dark frame) keeps its integration time
+            self.integrationentry.delete(0, "end")
+            self.integrationentry.insert(0, int(self.IntTime / 1000))
+            return
         IntTimeTemp = self.integrationentry.get()
         if IntTimeTemp.isdigit() == True:
             if int(IntTimeTemp) > 5000: # maxIntTime may be up to 60 seconds depending on spectrometer model
@@ -478,7 +773,16 @@ class App(tk.Frame):
                 messagebox.showerror("Entry error", msg)
             else:
                 self.IntTime = int(IntTimeTemp) * 1000  #convert ms to microseconds
-                spec.integration_time_micros(self.IntTime)  #send IntTime to spectrograph
+                with spec_lock:  # waits for a running read to finish
+                    spec.integration_time_micros(self.IntTime)  #send IntTime to spectrograph
+                if self.corrector.dark_frame is not None and self.corrector.dark_inttime != self.IntTime:
+                    self.corrector.set_dark_frame(None)  # dark counts scale with the integration time
+                    self.button_darkframe.config(text='Store dark')
+                    self.PStext.insert(tk.END, "dark frame cleared, integration time changed \n")
+                    self.PStext.see(tk.END)
+                if self.worker is not None and self.worker.armed:
+                    self.disarm()
+                    self.arm()  # ring length in frames depends on IntTime
                 self.integrationentry.delete(0, "end")
                 self.integrationentry.insert(0, int(self.IntTime / 1000)) #write in ms, but IntTime is in microseconds
 
@@ -507,80 +811,344 @@ class App(tk.Frame):
             self.timelimitentry.insert(0, self.timelimit) # reset original time limit to box
             
         if self.DisplayCode == 0:
-            self.ax1.set_xlim(-1, self.timelimit*1.05)
+            self.ax1.set_xlim(-1 - self.pretrigger, self.timelimit*1.05)
             self.canvas.draw()
+
+    def PreTrigger_change(self, event):
+        pretriggertemp = self.pretriggerentry.get()
+        try:
+            pretriggertemp = float(pretriggertemp)
+            if pretriggertemp >= 0 and pretriggertemp <= 10:   # ring of full spectra is held in memory
+                self.pretrigger = pretriggertemp
+        except ValueError:  #non numerical entry handler
+            pass
+        self.pretriggerentry.delete(0, 'end')
+        self.pretriggerentry.insert(0, self.pretrigger)
+        self.disarm()
+        self.arm()
+        if self.DisplayCode == 0:
+            self.ax1.set_xlim(-1 - self.pretrigger, self.timelimit*1.05)
+            self.canvas.draw()
+
+    def DisplayRate_change(self, event):
+        displayratetemp = self.displayrateentry.get()
+        try:
+            displayratetemp = int(displayratetemp)
+            if displayratetemp >= 10 and displayratetemp <= 60:   # faster than the eye (or a Pi) can use is wasted
+                self.DisplayRate = displayratetemp
+                self.DisplayInterval = int(1000 / self.DisplayRate)
+        except:  #non numerical entry handler
+            pass
+        self.displayrateentry.delete(0, 'end')
+        self.displayrateentry.insert(0, self.DisplayRate) # accepted value, or the original one
+
+    def ExtraChannels_change(self, event):
+        channelstemp = [c.strip() for c in self.extrachannelsentry.get().split(',') if c.strip()]
+        try:
+            ChannelMap(self.wavelengths, channelstemp)  # checks every entry
+            self.extrachannels = channelstemp
+        except ValueError as e:
+            messagebox.showerror("Entry error", "Extra channels are wavelengths or ranges (nm) separated by commas, e.g. 357.9, 425.3-425.7\n" + str(e))
+        self.extrachannelsentry.delete(0, 'end')
+        self.extrachannelsentry.insert(0, ", ".join(self.extrachannels))
+    def Averaging_change(self, event):
+        coadd, boxcar = self.averager.coadd, self.averager.boxcar
+        try:
+            coaddtemp = int(self.coaddentry.get())
+            if coaddtemp >= 1 and coaddtemp <= 100:
+                coadd = coaddtemp
+        except ValueError:  #non numerical entry handler
+            pass
+        try:
+            boxcartemp = int(self.boxcarentry.get())
+            if boxcartemp >= 1 and boxcartemp <= 51:   # wider than a line is no longer a channel
+                boxcar = boxcartemp
+        except ValueError:
+            pass
+        if not self.draining:  # the running time series keeps its averaging
+            self.averager = FrameAverager(len(self.wavelengths), coadd, boxcar)
+        self.coaddentry.delete(0, 'end')
+        self.coaddentry.insert(0, self.averager.coadd)
+        self.boxcarentry.delete(0, 'end')
+        self.boxcarentry.insert(0, self.averager.boxcar) # accepted values; even widths become odd
+    def Cooldown_change(self, event):
+        try:
+            cooldowntemp = float(self.cooldownentry.get())
+            if cooldowntemp >= 0 and cooldowntemp <= 3600:
+                self.cooldown = cooldowntemp
+                if self.sequence is not None:
+                    self.sequence.cooldown = cooldowntemp  # from the next wait on
+        except ValueError:  #non numerical entry handler
+            pass
+        self.cooldownentry.delete(0, 'end')
+        self.cooldownentry.insert(0, self.cooldown)
+
+    def RunSequence_click(self, event):
+        if self.sequence is not None:
+            return self.stop_sequence("stopped")  # button reads 'Stop sequence' while one runs
+        if self.draining or self.darkworker is not None:
+            return
+        methodfile = askopenfilename(title="Methods file (Cancel repeats the current settings)",
+                                     filetypes=[("Methods", "*.csv"), ("All files", "*.*")])
+        if methodfile:
+            try:
+                methods = read_methods(methodfile)
+            except (ValueError, OSError) as e:
+                messagebox.showerror("Methods file", str(e))
+                return
+        else:
+            replicates = simpledialog.askinteger("Run sequence", "Number of firings", minvalue=1, maxvalue=1000, parent=self)
+            if replicates is None:
+                return
+            methods = [{"name": "run", "replicates": replicates}]
+        filename = asksaveasfilename(title="Base name for the runs", defaultextension=".txt",
+                                     filetypes=[("Text files", "*.txt"), ("ETA run (binary)", "*.npz")])
+        if not filename:
+            return
+        self.sequence = RunSequence(methods, filename, self.cooldown)
+        self.button_sequence.config(text='Stop sequence')
+        self.next_in_sequence()
+
+    def next_in_sequence(self):
+        self.sequence_after = None
+        self.stop_warm()
+        if self.sequence is None:
+            return
+        run = self.sequence.next()
+        if run is None:
+            return self.stop_sequence("finished")
+        method, filename = run
+        error = self.apply_method(method)
+        if error:
+            self.stop_sequence("stopped, " + error)
+            messagebox.showerror("Run sequence", error)
+            return
+        self.PStext.insert(tk.END, "firing " + str(self.sequence.index + 1) + " of " + str(len(self.sequence)) + " \n")
+        self.PStext.see(tk.END)
+        self.PS_go(None)
+
+    def apply_method(self, method):
+        # returns a message if the method cannot be used, else None
+        # wavelengths are checked against the detector, not the zoomed axis the boxes use
+        boxes = {"line": self.wavelen1box, "bkg": self.wavelen2box, "base": self.wavelen3box}
+        if any(key in method for key in boxes):
+            for key, box in boxes.items():
+                if key in method:
+                    try:
+                        wavelength = float(method[key])
+                    except ValueError:
+                        return "method " + method["name"] + ": " + key + " wavelength " + method[key] + " is not a number"
+                    if not self.wavelengths[0] <= wavelength <= self.wavelengths[-1]:
+                        return ("method " + method["name"] + ": " + key + " wavelength " + method[key] + " nm is outside the detector ("
+                                + str(round(self.wavelengths[0], 1)) + " to " + str(round(self.wavelengths[-1], 1)) + " nm)")
+                    box.delete(0, 'end')
+                    box.insert(0, self.wavelengths[int(np.searchsorted(self.wavelengths, wavelength, side='left'))])
+            self.wavelenaction()
+        if "slot" in method:
+            self.PS_slot.delete(0, 'end')
+            self.PS_slot.insert(0, method["slot"])
+        if "inttime" in method and method["inttime"] * 1000 != self.IntTime:
+            self.integrationentry.delete(0, 'end')
+            self.integrationentry.insert(0, method["inttime"])
+            self.IntegrationTime(None)
+        if "duration" in method:
+            self.timelimitentry.delete(0, 'end')
+            self.timelimitentry.insert(0, method["duration"])
+            self.TimeLimit_change(None)
+
+    def stop_sequence(self, reason):
+        if self.sequence is None:
+            return
+        if self.sequence_after is not None:
+            self.after_cancel(self.sequence_after)
+            self.sequence_after = None
+        self.stop_warm()
+        self.PStext.insert(tk.END, "sequence " + reason + " after " + str(self.sequence.index) + " of " + str(len(self.sequence)) + " firings \n")
+        self.PStext.see(tk.END)
+        self.sequence = None
+        self.button_sequence.config(text='Run sequence')
+
+    def keep_warm(self):
+        # keep the detector reading between firings, as it does during a run
+        if self.worker is not None and self.worker.armed:
+            return  # the pre-trigger ring is already reading
+        self.warm = AcquisitionThread(get_intensities, None, self.IntTime / 1000000, latest_only=True)
+        self.warm.start()
+
+    def stop_warm(self):
+        if self.warm is not None:
+            self.warm.stop()  # spec_lock keeps its last read from overlapping the next user of spec
+            self.warm = None
+
+    def Profile_change(self):
+        if self.profile_on.get():
+            profiler.clear()  # a fresh trace each time it is switched on
+            profiler.enable()
+        else:
+            profiler.disable()
+
+    def SaveProfile(self, event):
+        if not len(profiler):
+            self.PStext.insert(tk.END, "no profile recorded, tick 'Profile stages' first \n")
+            self.PStext.see(tk.END)
+            return
+        filename = asksaveasfilename(initialdir=os.getcwd(), defaultextension='.json',
+                                     filetypes=[('Chrome trace', '*.json')], title="Save stage profile")
+        if not filename:
+            return
+        profiler.save_trace(filename)
+        summary = profiler.summary()
+        with open(os.path.splitext(filename)[0] + "_summary.txt", 'w') as f:
+            f.write(summary + "\n")
+        self.PStext.insert(tk.END, summary + " \n")
+        self.PStext.see(tk.END)
+
+    def Corrections_change(self):
+        if self.draining:  # a run keeps the corrections it started with
+            self.darkcorr_on.set(int(self.corrector.electric_dark))
+            self.nonlincorr_on.set(int(self.corrector.linearize))
+            return
+        self.corrector.electric_dark = bool(self.darkcorr_on.get())
+        self.corrector.linearize = bool(self.nonlincorr_on.get())
+
+    def DarkFrame(self, event):
+        # 'Store dark' averages frames taken with the source blocked; 'Clear dark' goes back to raw or electric dark
+        if self.draining or self.darkworker is not None:
+            return
+        if self.corrector.dark_frame is not None:
+            self.corrector.set_dark_frame(None)
+            self.button_darkframe.config(text='Store dark')
+            return
+        # read on a thread so the window stays live; at long integration times this takes minutes
+        self.darkworker = AcquisitionThread(get_intensities, None, self.IntTime / 1000000)
+        self.darkworker.start()
+        self.darkread = []
+        self.button_darkframe.config(text='Reading dark')
+        self.after(self.DisplayInterval, self.collect_dark)
+
+    def collect_dark(self):
+        # called from the Tk loop until 'Store dark' has its frames
+        worker = self.darkworker
+        self.darkread.extend(ydata for frametime, ydata in worker.get_frames())
+        if worker.error is None and len(self.darkread) < self.darkframes:
+            self.after(self.DisplayInterval, self.collect_dark)
+            return
+        worker.stop()
+        self.darkworker = None
+        if worker.error is not None:
+            self.button_darkframe.config(text='Store dark')
+            self.PStext.insert(tk.END, "spectrometer read failed, no dark frame stored: " + str(worker.error) + " \n")
+        else:
+            self.corrector.set_dark_frame(self.darkread[:self.darkframes], self.IntTime)
+            self.button_darkframe.config(text='Clear dark')
+            self.PStext.insert(tk.END, "dark frame of " + str(self.darkframes) + " frames stored \n")
+        self.darkread = []
+        self.PStext.see(tk.END)
 ## start addition for dynamic Serial selection
     def Connect_PS(self, event):
-        if(ser.isOpen() == False):  # check if serial port is open
-            try:
+        def toggle():  # runs on the serial thread
+            if(ser.isOpen() == False):  # check if serial port is open
                 ser.open() #without explicit open/close we just assume ser is open and blocking other programs?
+            else:
+                ser.close()
+            return ser.isOpen()
+        self.when_done(self.serial.call(toggle), self.show_connection)
+
+    def show_connection(self, future):
+        try:
+            if future.result():
                 self.PSconnect.configure(background = 'light green')
                 self.PStext.insert(tk.END, "connected serial \n")
-            except:
-                self.PStext.insert(tk.END, "is another program using the serial port? \n")
-        else:
-            ser.close()
-            self.PStext.insert(tk.END, "disconnected serial \n")
-            #print("tried to close serial")
-            self.PSconnect.configure(background = 'pink')
-               
+            else:
+                self.PStext.insert(tk.END, "disconnected serial \n")
+                self.PSconnect.configure(background = 'pink')
+        except Exception:
+            self.PStext.insert(tk.END, "is another program using the serial port? \n")
+        self.PStext.see(tk.END)
+
     def on_selectComm(self, event):
         #print (ser)
         port = self.ports_box.get()
-        ser.port = port
+        self.serial.call(setattr, ser, 'port', port)  # reopens an open port, so not on the Tk thread
         #print("after get")
         #print(ser)
+
+    def show_saved(self, future):
+        try:
+            paths = future.result()
+        except Exception as e:
+            messagebox.showerror("Save failed", str(e))
+            return
+        message = "saved " + ", ".join(os.path.basename(p) for p in paths)
+        if self.writer.pending():
+            message += " (" + str(self.writer.pending()) + " still saving)"
+        self.PStext.insert(tk.END, message + " \n")
+        self.PStext.see(tk.END)
+
+    def show_writer(self):
+        # progress of the background saves in the title bar
+        status = self.writer.status()
+        self.master.wm_title("Tungsten ETA Data Collection" + (" - " + status if status else ""))
+        if self.writer.pending():
+            self.after(250, self.show_writer)
+
+    def list_ports(self):
+        self.ports_box.configure(values = scanSerial())
+
+    def when_done(self, future, callback):
+        # replies of the serial thread are handled here, on the Tk thread
+        if future.done():
+            callback(future)
+        else:
+            self.after(10, self.when_done, future, callback)
 ## end addition
     def PS_go(self, event):  # runs power supply and starts time-based data collection in one click
-        gc.collect()
+        if self.draining or self.darkworker is not None:
+            return  # a run or 'Store dark' is still reading
+        if self.sequence is not None and event is not None:
+            return  # the sequence fires the runs
+        self.gcguard = GCGuard()  # its full collection comes before time zero, not inside the run
+        self.gcguard.start()
         self.DisplayCode = 1 # simulates button press to go to time series mode
         self.DisplayMode(event)
         self.btn.config(text='Running')
+        if self.worker is not None and self.worker.armed:
+            self.worker.trigger()  # time zero just before the command; frames before it are kept
         GO_string = "R " + self.PS_slot.get()  # sends 'R' as in Run and the slot number formatted for MasTech powersupply
         self.PStext.insert(tk.END, "sent: ")
         self.PStext.insert(tk.END, GO_string)
         self.PStext.insert(tk.END, "\n")
-        #send serial command to start power supply
-        if(ser.isOpen() == False):
-            ser.open()
-        ser.write(str.encode(GO_string))  # will not read the PS serial output during the sequence
-        ser.write(bytes("\r",'utf-8')) # required carriage return for the UART on Cypress PSoC
-        ser.flush()  # flush serial buffer to avoid stray commands
-        ser.close()  # really not reading serial during data recording
+        #send serial command to start power supply; \r is required by the UART on Cypress PSoC
+        self.gocommand = self.serial.send(GO_string + "\r", close=True)  # not reading serial during data recording
+        self.when_done(self.gocommand, self.readSerial)
         return self.update_graph()  #start recording data
 
-    def readSerial(self):
-        if(ser.isOpen() == False):  # check if serial port is open
-            ser.open()
-        if ser.inWaiting() > 0:  # check if bytes are waiting in buffer
-            data_str = ser.read(ser.inWaiting()).decode('ascii') 
+    def readSerial(self, future):
+        try:
+            data_str = future.result().response
+        except Exception:
+            self.PStext.insert(tk.END, "is another program using the serial port? Or no port selected? \n")
+            self.PStext.see(tk.END)
+            return
+        if len(data_str) > 0:
             self.PStext.insert(tk.END, data_str) # insert received data in textbox
             self.PStext.insert(tk.END, "\n")
             self.PStext.see(tk.END)
-        time.sleep(0.01)  # tiny pause in case other processes need run
-        #ser.close()  # leave open or communication gets lost, only 'close' is in the PS_go() def
-            
+
     def writeSerial(self, event):
-        if(ser.isOpen() == False):  # check if serial port is open
-            ser.open()
-            self.PSconnect.configure(background = 'light green')
         self.PStext.insert(tk.END, "sent: ")  # echos sent data 
         self.PStext.insert(tk.END, self.PSentry.get()) 
         self.PStext.insert(tk.END, "\n")
         datatosend = self.PSentry.get()  # get text string from entry box
         self.PSentry.delete(0, 'end')  # clear entry box
-        ser.write(bytes(datatosend,'utf-8'))  # write to serial as bytes
-        ser.write(bytes("\r",'utf-8')) #required carriage return for the UART on Cypress PSoC
-        ser.flush()  # avoids accidental stray instructions 
-        self.readSerial()
+        self.PSconnect.configure(background = 'light green')
+        # required carriage return for the UART on Cypress PSoC; the reply is read 10 ms later
+        self.when_done(self.serial.send(datatosend + "\r", listen=0.01), self.readSerial)
 
     def PS_EmergencyStop(self, event):
-        if(ser.isOpen() == False):  # check if serial port is open
-            ser.open()
+        self.stop_sequence("stopped")
         self.PStext.insert(tk.END, "sent: ESC \n")  # echos ESC sent
-        ser.write(bytes('\x1b','utf-8'))  # write to serial as bytes (\x1b is ESC)
-        ser.flush()  # avoids accidental stray instructions
-        self.readSerial()
+        self.when_done(self.serial.send('\x1b', listen=0.01, urgent=True), self.readSerial)  # \x1b is ESC
 ## start add for dynamic Serial selection        
 def scanSerial():
     ports = serial.tools.list_ports.comports()
@@ -645,8 +1213,12 @@ class BlitManager:
         for a in self._artists:
             fig.draw_artist(a)
 
-    def update(self):
-        """Update the screen with animated artists."""
+    def update(self, flush=True):
+        """Update the screen with animated artists.
+
+        Use flush=False when called from a Tk callback; the main loop then
+        handles the pending events itself.
+        """
         cv = self.canvas
         fig = cv.figure
         # paranoia in case we missed the draw event,
@@ -655,30 +1227,43 @@ class BlitManager:
 #            self.on_draw(None)
 #        else:
         # restore the background
+        t0 = perf_counter()
         cv.restore_region(self._bg)
+        t1 = perf_counter()
         # draw all of the animated artists
         self._draw_animated()
+        t2 = perf_counter()
         # update the GUI state
         cv.blit(fig.bbox)
+        t3 = perf_counter()
         # let the GUI event loop process anything it has to do
-        cv.flush_events()
+        if flush:
+            cv.flush_events()
+        if profiler.enabled:
+            profiler.record("restore_region", t0, t1)
+            profiler.record("draw_artist", t1, t2)
+            profiler.record("blit", t2, t3)
+            if flush:
+                profiler.record("flush_events", t3)
 
-def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basewave):
-    filenameforWriting = asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("All files", "*.*")])
+def saveFile(data_time, channels, channelmap, diagnostics, settings=None, filename=None, writer=None):
+    # channels: counts of line, bkg, base and any extra channel; channelmap: their ChannelMap
+    # filename: given by a run sequence, otherwise asked for
+    # writer: a BackgroundWriter to do the writing; returns its Future, or None if nothing was queued
+    settings = settings or {}  # IntTime, slot, events and missed_per_frame, stored in the binary file
+    filenameforWriting = filename or asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("ETA run (binary)", "*.npz"),("All files", "*.*")])
     if not filenameforWriting:
-        pass  #exits on Cancel
+        return None  #exits on Cancel
+    elif os.path.splitext(filenameforWriting)[1].lower() == ".npz":
+        job = (save_run, filenameforWriting, data_time, np.column_stack(channels), channelmap.centres,
+               spec.model, diagnostics, channel_names(len(channels)), settings.get("IntTime"), settings.get("slot"), settings.get("events"),
+               None, settings.get("missed_per_frame"))
     else:
-        path_ext = os.path.splitext(filenameforWriting)
-        linefile = str(path_ext[0] + "line" + path_ext[1])
-        bkgfile = str(path_ext[0] + "bkg" + path_ext[1])
-        basefile = str(path_ext[0] + "base" + path_ext[1])
-        specmodel = spec.model
-        lineheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + linewave + "\n# Analytical Line data \n# Time (s), Count"
-        bkgheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + bkgwave + "\n# Background data \n# Time (s), Count"
-        baseheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + basewave + "\n# Baseline data \n# Time (s), Count"
-        np.savetxt(linefile, np.transpose([data_time, data_line]), delimiter=',', newline='\n', header=lineheader, comments='')
-        np.savetxt(bkgfile, np.transpose([data_time, data_bkg]), delimiter=',', newline='\n', header=bkgheader, comments='')
-        np.savetxt(basefile, np.transpose([data_time, data_base]), delimiter=',', newline='\n', header=baseheader, comments='')
+        job = (write_timeseries, filenameforWriting, data_time, channels, channelmap.labels, spec.model, diagnostics)
+    if writer is None:
+        job[0](*job[1:])
+        return None
+    return writer.submit(os.path.basename(filenameforWriting), *job)
 
 def processData():
     pass
@@ -689,9 +1274,36 @@ def processData():
 def main():
     root = tk.Tk()
     root.wm_title("Tungsten ETA Data Collection")
-    app = App(root)
-    app.pack()
+    splash = tk.Label(root, text=startup["status"], padx=60, pady=60)
+    splash.pack()
+    root.update()  # window is on screen before anything slow happens
+    window_time = perf_counter() - STARTED
+    threading.Thread(target=discover_hardware, daemon=True).start()
+    apps = []  # the App, once the hardware is found
+
+    def wait_for_hardware():
+        if spec is None and startup["error"] is None:
+            splash.config(text=startup["status"])  # progress
+            root.after(50, wait_for_hardware)
+            return
+        if startup["error"] is not None:
+            messagebox.showerror("Error", "No spectrometer attached")
+            root.destroy()
+            return
+        splash.destroy()
+        app = App(root)
+        app.pack()
+        apps.append(app)
+        ready_time = perf_counter() - STARTED
+        message = "window %.2f s, ready %.2f s after start" % (window_time, ready_time)
+        print("Startup:", message)
+        app.PStext.insert(tk.END, message + " \n")
+    root.after(50, wait_for_hardware)
     root.mainloop()
+    for app in apps:
+        if app.writer.pending():
+            print("Waiting for", app.writer.pending(), "saves to finish")
+        app.writer.close()  # queued runs are written before the program ends
 
 if __name__ == '__main__':
     main()
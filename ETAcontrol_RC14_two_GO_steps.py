@@ -15,6 +15,10 @@
 ## 02/2024 updated scalar extraction to comply with Numpy > 1.25 standards
 ## 01/2025 Separated dry/pyrolyze step from atomize/clean step.  Separate memory slots must be used.
 ##          The Measure button calls the two memory slots in sequence.  
+## 10/2026 times the dry and start commands left the port are saved as event markers
+##          ("# Event dry R n at (s) =", "# Event start R n at (s) =") on the time axis of the run.
+## 10/2026 note: the spectrometer is still read and drawn in the Tk callback; the acquisition thread of
+##          ETAcontrol_RC14.py (ETAacquisition.AcquisitionThread) has not been ported to this program.
 
 try:
     import Tkinter as tk
@@ -48,6 +52,8 @@ import gc  #garbage collection
 import serial
 import serial.tools.list_ports
 
+from ETAacquisition import events_header
+
 # Enumerate spectrometer, set a default integration time, get x & y extents
 try:
     spec = sb.Spectrometer.from_serial_number()
@@ -100,6 +106,7 @@ class App(tk.Frame):
         self.IntTimeLimits = spec.integration_time_micros_limits #BIGGER RANGE THAN REALLY EXISTS; this is available if needed;reads as tuple
         self.max_intensity = spec.max_intensity  #fullscale limit
         self.timelimit = 5 # time in SECONDS, default to 5 s for convenience
+        self.commandtimes = []  # (event name, perf_counter) of the power supply commands of this run
         
         #preload wavelength values
         self.wavelength1 = tk.StringVar(self, self.wavelengths[int(len(self.wavelengths) * 0.8)])
@@ -318,6 +325,8 @@ class App(tk.Frame):
                 self.bkgdata.set_data(xdata, bkgdata)
                 #self.basedata.set_data(xdata, basedata)  # not usually displayed
                 self.bm.update()  # blit manager call
+            events = [(name, t - starttime) for name, t in self.commandtimes]  # on the time axis of the data
+            self.commandtimes = []
         #diagnostics printed to terminal, can be removed ----
             #print("per point = ", str((perf_counter()-starttime)/(self.timelimit * int(1000/self.IntTime*1000))))
             #print("std dev = ", str(np.std(np.diff(xdata))))
@@ -336,7 +345,7 @@ class App(tk.Frame):
             linedata=np.asarray(linedata)
             bkgdata=np.asarray(bkgdata)
             basedata=np.asarray(basedata)
-            saveFile(xdata, linedata, bkgdata, basedata, self.wavelength1, self.wavelength2, self.wavelength3)
+            saveFile(xdata, linedata, bkgdata, basedata, self.wavelength1, self.wavelength2, self.wavelength3, events)
 
     def wavelenaction(self):
         self.wavelength1 = self.wavelen1box.get()
@@ -556,9 +565,10 @@ class App(tk.Frame):
             ser.open()
         ser.write(str.encode(GO_string))  # will not read the PS serial output during the sequence
         ser.write(bytes("\r",'utf-8')) # required carriage return for the UART on Cypress PSoC
-        ser.flush()  # flush serial buffer to avoid stray commands
+        ser.flush()  # flush serial buffer to avoid stray commands; returns once the command is out
+        self.commandtimes = [("dry " + GO_string, perf_counter())]
         ser.close()  # really not reading serial during data recording
-        return self.PS_go()  #calls the atomization program
+        return self.PS_go(event)  #calls the atomization program
 
     def PS_go(self, event):  # runs power supply and starts time-based data collection in one click
         gc.collect()
@@ -574,7 +584,8 @@ class App(tk.Frame):
             ser.open()
         ser.write(str.encode(GO_string))  # will not read the PS serial output during the sequence
         ser.write(bytes("\r",'utf-8')) # required carriage return for the UART on Cypress PSoC
-        ser.flush()  # flush serial buffer to avoid stray commands
+        ser.flush()  # flush serial buffer to avoid stray commands; returns once the command is out
+        self.commandtimes.append(("start " + GO_string, perf_counter()))
         ser.close()  # really not reading serial during data recording
         return self.update_graph()  #start recording data
 
@@ -692,7 +703,7 @@ class BlitManager:
         # let the GUI event loop process anything it has to do
         cv.flush_events()
 
-def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basewave):
+def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basewave, events=()):
     filenameforWriting = asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"),("All files", "*.*")])
     if not filenameforWriting:
         pass  #exits on Cancel
@@ -702,9 +713,10 @@ def saveFile(data_time, data_line, data_bkg, data_base, linewave, bkgwave, basew
         bkgfile = str(path_ext[0] + "bkg" + path_ext[1])
         basefile = str(path_ext[0] + "base" + path_ext[1])
         specmodel = spec.model
-        lineheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + linewave + "\n# Analytical Line data \n# Time (s), Count"
-        bkgheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + bkgwave + "\n# Background data \n# Time (s), Count"
-        baseheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + basewave + "\n# Baseline data \n# Time (s), Count"
+        eventlines = events_header(events) + "\n" if events else ""  # power supply commands on the time axis
+        lineheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + linewave + "\n# Analytical Line data \n" + eventlines + "# Time (s), Count"
+        bkgheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + bkgwave + "\n# Background data \n" + eventlines + "# Time (s), Count"
+        baseheader = "# Spectrometer = " + specmodel + "\n# Wavelength (nm) = " + basewave + "\n# Baseline data \n" + eventlines + "# Time (s), Count"
         np.savetxt(linefile, np.transpose([data_time, data_line]), delimiter=',', newline='\n', header=lineheader, comments='')
         np.savetxt(bkgfile, np.transpose([data_time, data_bkg]), delimiter=',', newline='\n', header=bkgheader, comments='')
         np.savetxt(basefile, np.transpose([data_time, data_base]), delimiter=',', newline='\n', header=baseheader, comments='')
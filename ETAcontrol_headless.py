@@ -0,0 +1,328 @@
+## Headless time series recorder -- no Tk window, no Matplotlib.
+#  For unattended stations (e.g. Raspberry Pi) that need the full spectrometer rate.
+#  Starts the power supply program, records line/bkg/base and writes the same
+#  three text files as the GUI (ReadNProcess reads them unchanged).
+#
+#  example:
+#   python ETAcontrol_headless.py --wavelengths 358.3 360.1 350.0 --inttime 7 --duration 10
+#          --supply psoc --port /dev/ttyUSB0 --slot 1 --output runs/Cr_10ppm.txt
+#  without hardware:
+#   python ETAcontrol_headless.py --simulate testdata.zip --supply none --output sim.txt
+## 10/2026 first version
+## 10/2026 --simulate uses the simulated spectrometer in ETAsimulator.py
+## 10/2026 an --output name ending in .npz writes one binary run file instead of three text files
+## 10/2026 --extra adds monitored pixels or summed bands; line/bkg/base may be bands too (ChannelMap)
+## 10/2026 time the start command left the port is saved as an event marker on the run time axis
+## 10/2026 --coadd and --boxcar average frames and smooth across pixels before channels are taken
+## 10/2026 --dark-pixels, --nonlinearity and --dark-frame correct frames in NumPy (FrameCorrector);
+#  --record-dark writes the mean of a few frames and the integration time to a .npz file for --dark-frame
+#  and exits; --dark-frame refuses a file taken at another integration time
+## 10/2026 cyclic GC frozen and disabled during the run (GCGuard), pauses reported in the header
+## 10/2026 --profile saves a Chrome trace of the read and processing time of every frame and GC pauses
+## 10/2026 several spectrometers: --serial (or --simulate) takes one entry per device, each read by its own
+#  thread on the same perf_counter time zero.  line/bkg/base are on the first; --extra channels go to the
+#  first device covering them, or "2:425.3" names one.  Per-device frame and USB data rates are in the header.
+#   python ETAcontrol_headless.py --serial FLMS01234 USB2G5678 --extra 2:766.5 --supply none --output k.npz
+
+import argparse
+import os #for filename and path handling
+import sys
+from time import (perf_counter)
+
+import numpy as np
+import serial
+
+from ETAacquisition import (AcquisitionThread, TimeSeriesBuffer, run_capacity,
+                            timing_summary, timing_header, write_timeseries, save_run, ChannelMap, channel_names,
+                            events_header, FrameAverager, FrameCorrector, StageProfiler,
+                            GCGuard, parse_channel, nearest_frames, throughput_header)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record an ETA time series without the GUI.")
+    parser.add_argument("--wavelengths", nargs=3, metavar=("LINE", "BKG", "BASE"),
+                        help="line, background and baseline wavelengths (nm); nearest pixels are used, "
+                             "a range such as 357.9-358.7 sums its pixels. "
+                             "Default is 80, 70 and 60 %% along the detector like the GUI.")
+    parser.add_argument("--extra", nargs="+", default=[], metavar="NM",
+                        help="further channels recorded as ch4, ch5, ...; wavelengths or ranges as for --wavelengths, "
+                             "on the first spectrometer covering them or on the one numbered as in 2:766.5")
+    parser.add_argument("--inttime", type=int, default=25, help="integration time in ms (4 to 5000), default 25")
+    parser.add_argument("--coadd", type=int, default=1, help="consecutive frames averaged into one, default 1 (off)")
+    parser.add_argument("--boxcar", type=int, default=1, help="odd width in pixels of a moving average along the detector, default 1 (off)")
+    parser.add_argument("--dark-pixels", action="store_true", help="subtract the mean of the electric dark pixels")
+    parser.add_argument("--nonlinearity", action="store_true", help="apply the spectrometer's nonlinearity correction")
+    parser.add_argument("--dark-frame", metavar="NPZ", help="subtract this stored dark frame (see --record-dark), taken at the same --inttime; "
+                                                            "NAME_2.npz, NAME_3.npz, ... for further spectrometers")
+    parser.add_argument("--record-dark", metavar="NPZ", help="average 20 frames of each spectrometer into dark frame files and exit")
+    parser.add_argument("--duration", type=float, default=5, help="length of the time series in s, default 5")
+    parser.add_argument("--supply", choices=["psoc", "bk", "none"], default="psoc",
+                        help="power supply protocol: Cypress PSoC 'R n', BK 1696 'RUNP' or none")
+    parser.add_argument("--port", help="serial port of the power supply, e.g. COM3 or /dev/ttyUSB0")
+    parser.add_argument("--slot", type=int, default=1, help="power supply memory slot (PSoC only), default 1")
+    parser.add_argument("--serial", dest="serial_numbers", nargs="+", metavar="SERIAL",
+                        help="spectrometer serial numbers, one per device recorded; default the first found")
+    parser.add_argument("--simulate", nargs="+", metavar="SOURCE",
+                        help="use simulated spectrometers, one per source: 'synthetic' or a zip of a saved run")
+    parser.add_argument("--profile", metavar="JSON", help="save a Chrome trace of every stage here and print a summary")
+    parser.add_argument("--output", help="file name; 'line', 'bkg', 'base' are added before the extension, "
+                                                        "or one binary run file for a .npz name")
+    args = parser.parse_args(argv)
+    if not 4 <= args.inttime <= 5000:
+        parser.error("integration time must be between 4 and 5000 ms")
+    if args.coadd < 1 or args.boxcar < 1:
+        parser.error("--coadd and --boxcar must be at least 1")
+    if args.output is None and args.record_dark is None:
+        parser.error("--output is required")
+    if args.simulate and args.serial_numbers:
+        parser.error("--serial and --simulate cannot be combined")
+    if args.supply != "none" and not args.port and args.record_dark is None:
+        parser.error("--port is required to start the power supply")
+    return args
+
+
+def open_spectrometer(serial_number, IntTime, simulate=None):
+    if simulate:
+        from ETAsimulator import SimulatedSpectrometer
+        spec = SimulatedSpectrometer.from_source(simulate)
+    else:
+        import seabreeze.spectrometers as sb
+        spec = sb.Spectrometer.from_serial_number(serial_number)
+    spec.integration_time_micros(IntTime)
+    return spec
+
+
+def start_power_supply(supply, port, slot):
+    # same settings and command strings as ETAcontrol_RC14.py and ETAcontrolBK_v3.py
+    # returns the start command and the perf_counter time it had left the port
+    if supply == "psoc":
+        ser = serial.Serial(port=port, baudrate=57600, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                            bytesize=serial.EIGHTBITS, timeout=0, writeTimeout=0)
+        GO_string = "R " + str(slot)
+        ser.write(str.encode(GO_string))
+        ser.write(bytes("\r",'utf-8')) # required carriage return for the UART on Cypress PSoC
+        ser.flush()
+        sent = perf_counter()
+        ser.close()
+    else:
+        ser = serial.Serial(port=port, baudrate=9600, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                            bytesize=serial.EIGHTBITS, timeout=1, writeTimeout=0)
+        address = 0
+        times = 1
+        GO_string = "RUNP"+"%02d"%address+"%04d\r"%times
+        ser.write(("SOUT"+"%02d"%address+"0\r").encode()) # connects outputs on BK 1696
+        ser.read_until(expected=b'\r')
+        ser.write(GO_string.encode())
+        ser.flush()
+        sent = perf_counter()
+        ser.read_until(expected=b'\r')
+        ser.close()
+    return GO_string, sent
+
+
+def device_file(filename, index):
+    # dark frame file of each spectrometer: name.npz for the first, name_2.npz, name_3.npz, ... for the others
+    if index == 0:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return stem + "_" + str(index + 1) + ext
+
+
+class Device:
+    """
+    One spectrometer of the run with its own channels, corrections,
+    averaging and acquisition thread.  Frame times of all devices are
+    perf_counter times, so they share one time zero.
+    """
+    def __init__(self, number, spec, args, profiler):
+        self.number = number  # 1 for the spectrometer of line, bkg and base
+        self.spec = spec
+        self.name = str(number) + " " + spec.model + " " + str(getattr(spec, "serial_number", ""))
+        self.wavelengths = np.around(spec.wavelengths(), decimals=3)
+        self.specs = []  # channel texts, see ChannelMap
+        self.corrector = FrameCorrector.from_spectrometer(spec)
+        self.corrector.electric_dark = args.dark_pixels
+        self.corrector.linearize = args.nonlinearity
+        if args.dark_frame:
+            filename = device_file(args.dark_frame, number - 1)
+            with np.load(filename) as dark:
+                if int(dark["integration_time_us"]) != args.inttime * 1000:
+                    print("Dark frame", filename, "was taken at", int(dark["integration_time_us"]) / 1000, "ms, not", args.inttime, "ms")
+                    sys.exit(1)
+                self.corrector.set_dark_frame([dark["dark"]], int(dark["integration_time_us"]))
+        if (args.dark_pixels and not self.corrector.dark_pixels.size) or (args.nonlinearity and not self.corrector.nonlinearity.size):
+            print("Spectrometer", spec.model, "has no coefficients for a requested correction; it is not applied")
+        self.averager = FrameAverager(len(self.wavelengths), args.coadd, args.boxcar)
+        self.profiler = profiler
+        self.frames = 0  # raw frames, before co-adding
+        self.first = None  # perf_counter time of the first and last raw frame
+        self.last = None
+
+    def read(self):
+        start = perf_counter()
+        ydata = self.spec.intensities(correct_dark_counts=False, correct_nonlinearity=False)
+        if self.profiler.enabled:
+            self.profiler.record("usb read " + str(self.number), start)
+        return ydata
+
+    def prepare(self, duration, IntTime):
+        self.channels = ChannelMap(self.wavelengths, self.specs)
+        self.waves = [str(self.wavelengths[lo]) if hi - lo == 1 else str(self.wavelengths[lo]) + "-" + str(self.wavelengths[hi - 1])
+                      for lo, hi in zip(self.channels.lo, self.channels.hi)]  # pixels actually used
+        self.run = TimeSeriesBuffer(run_capacity(duration, IntTime), len(self.channels))
+        self.worker = AcquisitionThread(self.read, duration, IntTime / 1000000)
+
+    def drain(self, starttime, timeout):
+        # frames since the last call, on the time axis that starts at starttime
+        for frametime, ydata in self.worker.get_frames(timeout=timeout):
+            start = perf_counter()
+            if self.first is None:
+                self.first = frametime
+            self.last = frametime
+            self.frames += 1
+            if self.corrector.active:
+                ydata = self.corrector.correct(ydata)
+            if self.averager.active:
+                averaged = self.averager.add(frametime, ydata)
+                if averaged is None:
+                    continue  # more frames to co-add
+                frametime, ydata = averaged
+            self.run.append(frametime - starttime, self.channels.extract(ydata))
+            if self.profiler.enabled:
+                self.profiler.record("process frame " + str(self.number), start)
+
+    def throughput(self):
+        elapsed = self.last - self.first if self.frames > 1 else 0.0
+        return throughput_header(self.name, self.frames, elapsed, self.worker.period, len(self.wavelengths),
+                                 self.worker.late, self.worker.missed)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    IntTime = args.inttime * 1000  # microseconds, as in the GUI
+    if args.simulate:
+        sources = [(None, source) for source in args.simulate]
+    else:
+        sources = [(serial_number, None) for serial_number in args.serial_numbers or [None]]
+    specs = []
+    try:
+        for serial_number, source in sources:
+            specs.append(open_spectrometer(serial_number, IntTime, source))
+    except Exception as e:
+        print("No spectrometer attached:", e)
+        sys.exit(1)
+
+    if args.record_dark:
+        for index, spec in enumerate(specs):
+            filename = device_file(args.record_dark, index)
+            dark = np.mean([spec.intensities(correct_dark_counts=False, correct_nonlinearity=False) for i in range(20)], axis=0)
+            with open(filename, 'wb') as f:  # np.savez would add .npz to another extension
+                np.savez(f, dark=dark, integration_time_us=IntTime)
+            print("Dark frame of 20 frames of", spec.model, "saved to", filename)
+            spec.close()
+        return
+
+    profiler = StageProfiler()
+    if args.profile:
+        profiler.enable()
+    devices = [Device(number, spec, args, profiler) for number, spec in enumerate(specs, start=1)]
+    wavelengths = devices[0].wavelengths
+    if args.wavelengths is None:
+        devices[0].specs = [str(wavelengths[int(len(wavelengths) * f)]) for f in (0.8, 0.7, 0.6)]
+    else:
+        devices[0].specs = list(args.wavelengths)
+    try:
+        for text in args.extra:
+            number, sep, wave = text.partition(":")
+            if sep:  # "2:425.3" is 425.3 nm on the second spectrometer
+                if not number.strip().isdigit() or not 1 <= int(number) <= len(devices):
+                    raise ValueError(text + " names no spectrometer; there are " + str(len(devices)))
+                parse_channel(wave, devices[int(number) - 1].wavelengths)
+                devices[int(number) - 1].specs.append(wave)
+                continue
+            for device in devices:  # otherwise the first spectrometer that covers it
+                try:
+                    parse_channel(text, device.wavelengths)
+                except ValueError:
+                    continue
+                device.specs.append(text)
+                break
+            else:
+                parse_channel(text, wavelengths)  # raises with the range of the first spectrometer
+        for device in devices:
+            device.prepare(args.duration, IntTime)
+    except ValueError as e:
+        print("Bad channel:", e)
+        sys.exit(1)
+    for device in devices:
+        print("Spectrometer", device.name, "channels (nm):", ", ".join(device.waves) or "none")
+
+    gcguard = GCGuard()  # collects now, then no automatic collection until the run is over
+    gcguard.start()
+    events = []
+    if args.supply != "none":
+        GO_string, sent = start_power_supply(args.supply, args.port, args.slot)
+        print("sent:", GO_string.strip())
+    for device in devices:
+        device.worker.start()  # one thread per spectrometer
+    starttime = devices[0].worker.starttime  # time zero of every device
+    if args.supply != "none":
+        events.append(("start " + GO_string.strip(), sent - starttime))
+    while any(device.worker.running() for device in devices):
+        for device in devices:
+            device.drain(starttime, 0.5 / len(devices))
+        gcguard.check()
+    gcguard.stop()
+
+    first = devices[0]
+    run = first.run
+    timing = timing_summary(run.times(), first.worker.period * first.averager.coadd)
+    diagnostics = timing_header(timing)
+    for device in devices:
+        if device.worker.error is not None:
+            diagnostics += "\n# Run ended early, device " + str(device.number) + " read failed: " + str(device.worker.error)
+            print("Spectrometer", device.name, "read failed, run ended early:", device.worker.error)
+    if first.averager.active:
+        diagnostics += "\n# Co-added frames = " + str(first.averager.coadd) + ", boxcar (pixels) = " + str(first.averager.boxcar)
+    diagnostics += "\n# Corrections = " + first.corrector.describe()
+    for device in devices[1:]:
+        diagnostics += "\n# Corrections of device " + str(device.number) + " = " + device.corrector.describe()
+    if any(device.run.dropped for device in devices):
+        diagnostics += "\n# Frames not stored (buffer full) = " + ", ".join(str(device.run.dropped) for device in devices)
+    diagnostics += "\n" + gcguard.describe()
+    for device in devices:
+        diagnostics += "\n" + device.throughput()
+    if len(devices) > 1:
+        diagnostics += "\n# Channels of other devices keep their own frame times; in .npz runs each value is the frame nearest a frame of device 1"
+    if events:
+        diagnostics += "\n" + events_header(events)
+    data = [device.run.channel(i) for device in devices for i in range(len(device.channels))]
+    labels = [wave + ("" if device.number == 1 else " (device " + str(device.number) + ")") for device in devices for wave in device.waves]
+    specmodel = " + ".join(device.spec.model for device in devices)
+    if args.output.lower().endswith(".npz"):
+        counts, column_times = [], []
+        for device in devices:
+            index = nearest_frames(run.times(), device.run.times())  # identity for device 1
+            for i in range(len(device.channels)):
+                if device.run.times().size == 0:  # no frames (e.g. a read error): NaN columns keep the other devices' data
+                    counts.append(np.full(index.size, np.nan))
+                    column_times.append(np.full(index.size, np.nan))
+                else:
+                    counts.append(device.run.channel(i)[index])
+                    column_times.append(device.run.times()[index])
+        save_run(args.output, run.times(), np.column_stack(counts), np.concatenate([device.channels.centres for device in devices]),
+                 specmodel, diagnostics, channel_names(len(data)), IntTime, args.slot if args.supply == "psoc" else None, events,
+                 np.column_stack(column_times) if len(devices) > 1 else None, timing["missed_per_frame"])
+    else:
+        write_timeseries(args.output, [device.run.times() for device in devices for i in range(len(device.channels))],
+                         data, labels, specmodel, diagnostics)
+    print(diagnostics)
+    if args.profile:
+        profiler.disable()
+        profiler.save_trace(args.profile)
+        print(profiler.summary())
+    for device in devices:
+        device.spec.close()
+
+if __name__ == '__main__':
+    main()
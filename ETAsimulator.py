@@ -0,0 +1,151 @@
+## Simulated spectrometer for benchmarking and testing without hardware.
+#  Drop-in for seabreeze's Spectrometer: wavelengths(), intensities(),
+#  integration_time_micros(), integration_time_micros_limits, max_intensity, model.
+#  Frames are paced like a free-running spectrometer: a call returns at the end
+#  of the integration period that is running when it is made, so a caller that
+#  falls behind sees doubled intervals exactly like the real instrument.
+#
+#  Source of the monitored signals:
+#   - a recorded run, e.g. testdata.zip or shorttest1.zip (line/bkg/base files),
+#     optionally "testdata.zip:withoutdarkcorr" to pick one set in the archive
+#   - "synthetic": incident emission with an atomization absorbance peak
+#
+#  The control programs use it when ETA_SIMULATE is set, e.g.
+#   ETA_SIMULATE=testdata.zip python ETAcontrol_RC14.py
+#   ETA_SIMULATE=synthetic python ETAcontrol_RC14.py
+## 10/2026 first version
+
+import io
+import os #for filename and path handling
+import time
+import zipfile
+from time import (perf_counter)
+
+import numpy as np
+
+from ETAacquisition import CHANNEL_FILES
+
+
+def load_trace(source):
+    """
+    Read line, bkg and base traces from a zip archive of saved runs.
+
+    `source` is "archive.zip" or "archive.zip:prefix".  Both the current
+    "time, count" pair format and the older two-row format are understood.
+    Returns (times, [line, bkg, base]) on the time axis of the line file.
+    """
+    path, _, prefix = source.partition(':')
+    traces = {}
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(archive.namelist()):
+            stem = os.path.splitext(os.path.basename(name))[0]
+            if not stem.startswith(prefix) or '_' in stem[len(prefix):]:
+                continue  # processed files (_abs, _sub) are not raw counts
+            for suffix in CHANNEL_FILES:
+                if stem.endswith(suffix) and suffix not in traces:
+                    text = archive.read(name).decode('ascii')
+                    data = np.genfromtxt(io.StringIO(text), dtype='float', delimiter=",", comments='#')
+                    if data.shape[0] != 2:
+                        data = data.T  # "time, count" pairs
+                    traces[suffix] = data
+    if len(traces) != 3:
+        raise ValueError("need line, bkg and base files in " + source)
+    times = traces['line'][0] - traces['line'][0][0]
+    channels = [np.interp(times, traces[s][0] - traces['line'][0][0], traces[s][1]) for s in CHANNEL_FILES]
+    return times, channels
+
+
+def synthetic_trace(duration=5.0, atomize=3.0, points=2000):
+    """
+    Line, bkg and base counts of a typical firing: dark level, filament glow
+    that rises during atomization, incident emission on the line and background
+    channels and an absorbance peak of about 0.5 on the line.
+    """
+    times = np.linspace(0, duration, points)
+    glow = 8000 / (1 + np.exp(-(times - atomize) / 0.08)) * np.exp(-np.clip(times - atomize - 0.6, 0, None) / 0.15)
+    base = 900 + glow
+    absorbance = 0.5 * np.exp(-((times - atomize - 0.15) / 0.12) ** 2)
+    line = base + 20000 * 10 ** (-absorbance)
+    bkg = base + 15000 * 10 ** (-0.05 * absorbance)  # small broadband background absorption
+    return times, [line, bkg, base]
+
+
+class SimulatedSpectrometer:
+    """
+    Software spectrometer that replays or synthesizes ETA signals.
+
+    Parameters
+    ----------
+    trace : tuple
+        (times, [line, bkg, base]) as returned by `load_trace` or
+        `synthetic_trace`.  The trace repeats when it runs out.
+
+    npixels : int
+        Detector length.  The line, bkg and base signals appear at 80, 70
+        and 60 % of it, the default wavelengths of the control programs.
+    """
+    model = "SIMULATED"
+    serial_number = "SIM00001"
+    max_intensity = 65535
+    integration_time_micros_limits = (1000, 65000000)
+
+    def __init__(self, trace=None, npixels=2048, wavelength_range=(200.0, 850.0), seed=None):
+        if trace is None:
+            trace = synthetic_trace()
+        self._trace_times, self._trace = trace
+        self._wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], npixels)
+        self._pixels = [int(npixels * f) for f in (0.8, 0.7, 0.6)]
+        # smooth continuum scaled so that the base pixel reads the base trace
+        x = np.linspace(-1, 1, npixels)
+        self._continuum = np.exp(-x ** 2 / 0.8)
+        self._continuum /= self._continuum[self._pixels[2]]
+        self._peak = np.exp(-0.5 * (np.arange(-6, 7) / 2.0) ** 2)  # line shape a few pixels wide
+        self._rng = np.random.default_rng(seed)
+        self._period = 0.1
+        self._t0 = perf_counter()
+
+    @classmethod
+    def from_serial_number(cls, serial=None):
+        return cls()
+
+    @classmethod
+    def from_source(cls, source):
+        """'synthetic' (or '1') for a generated firing, otherwise a zip archive of a saved run."""
+        if source in ("1", "synthetic"):
+            return cls(synthetic_trace())
+        return cls(load_trace(source))
+
+    def __repr__(self):
+        return "<SimulatedSpectrometer " + self.model + ":" + self.serial_number + ">"
+
+    def wavelengths(self):
+        return self._wavelengths.copy()
+
+    def integration_time_micros(self, integration_time_micros):
+        self._period = integration_time_micros / 1000000
+        self._t0 = perf_counter()  # the detector restarts its integration cycle
+
+    def reset(self):
+        """Start the replayed trace again from its first point."""
+        self._t0 = perf_counter()
+
+    def _wait_for_frame(self):
+        # frames end on a fixed grid; a late caller waits for the next grid point
+        now = perf_counter()
+        ready = self._t0 + (np.floor((now - self._t0) / self._period) + 1) * self._period
+        time.sleep(ready - now)  # releases the GIL like a USB read would
+        return ready - self._t0
+
+    def intensities(self, correct_dark_counts=False, correct_nonlinearity=False):
+        elapsed = self._wait_for_frame()
+        t = elapsed % self._trace_times[-1] if self._trace_times[-1] > 0 else 0.0
+        line, bkg, base = (np.interp(t, self._trace_times, channel) for channel in self._trace)
+        frame = self._continuum * base
+        for pixel, value in zip(self._pixels[:2], (line, bkg)):
+            lo = pixel - 6
+            frame[lo:lo + 13] += (value - frame[pixel]) * self._peak
+        frame += self._rng.normal(0, 1, frame.size) * np.sqrt(np.clip(frame, 1, None))  # shot noise
+        return np.clip(np.rint(frame), 0, self.max_intensity)
+
+    def close(self):
+        pass
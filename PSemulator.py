@@ -0,0 +1,142 @@
+## Power supply emulator on a Linux pseudo-terminal.
+#  Speaks the Cypress PSoC text commands used by ETAcontrol_RC14.py ("R n\r", ESC)
+#  or the BK Precision 1696 SDP commands used by ETAcontrolBK_v3.py
+#  (SESS, ENDS, GMAX, GETD, SOUT, RUNP, STOP), so the serial code can be exercised
+#  without hardware.  Every command is logged with the perf_counter time it
+#  arrived; on Linux perf_counter is CLOCK_MONOTONIC, so these times can be
+#  compared with times taken in the control program.
+#
+#  example:
+#   python PSemulator.py --protocol psoc --latency 0.005
+#   -> prints the port (e.g. /dev/pts/4); type it in the COM port box and press Enter
+## 10/2026 first version
+## 10/2026 GETD answers with a filament heating profile while a BK program runs
+
+import argparse
+import os #for filename and path handling
+import select
+import threading
+import time
+import tty
+from time import (perf_counter)
+
+
+class PowerSupplyEmulator(threading.Thread):
+    """
+    Answers power supply commands on a pseudo-terminal.
+
+    Parameters
+    ----------
+    protocol : str
+        'psoc' for the Cypress PSoC supply or 'bk' for the BK 1696.
+
+    latency : float
+        Seconds between receiving a command and answering it.
+
+    gmax : str
+        Answer to GMAX, maximum voltage (0.1 V) and current (0.01 A) digits.
+    """
+    def __init__(self, protocol='psoc', latency=0.0, gmax="200999"):
+        threading.Thread.__init__(self, daemon=True)
+        self.protocol = protocol
+        self.latency = latency
+        self.gmax = gmax
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # no echo or newline translation, like a real UART
+        self.port = os.ttyname(self._slave)
+        self.log = []  # (perf_counter time received, command text)
+        self.program = None  # slot or program currently running
+        self._program_start = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def first_command_time(self, prefix):
+        """perf_counter time at which the first command starting with prefix arrived, or None."""
+        for received, command in self.log:
+            if command.startswith(prefix):
+                return received
+        return None
+
+    def run(self):
+        pending = b""
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            pending += os.read(self._master, 1024)
+            received = perf_counter()
+            while True:
+                if pending.startswith(b'\x1b'):  # PSoC emergency stop has no terminator
+                    command, pending = b'\x1b', pending[1:]
+                elif b'\r' in pending:
+                    command, _, pending = pending.partition(b'\r')
+                else:
+                    break
+                text = command.decode('ascii', errors='replace')
+                self.log.append((received, text))
+                if self.latency > 0:
+                    time.sleep(self.latency)
+                os.write(self._master, self.respond(text).encode('ascii'))
+
+    def respond(self, text):
+        if self.protocol == 'psoc':
+            return self._respond_psoc(text)
+        return self._respond_bk(text)
+
+    def _respond_psoc(self, text):
+        if text == '\x1b':
+            self.program = None
+            return "Stopped\r\n"
+        if text.startswith('R '):
+            self.program = text[2:].strip()
+            return "Running slot " + self.program + "\r\n"
+        return "Received " + text + "\r\n"
+
+    def display(self):
+        """Voltage and current of a 2 s ramp to 12 V into a filament whose resistance rises with temperature."""
+        if self.program is None:
+            return 0.0, 0.0
+        volts = 12.0 * min(1.0, (perf_counter() - self._program_start) / 2.0)
+        return volts, volts / (1.0 + volts / 6.0)
+
+    def _respond_bk(self, text):
+        # SDP commands are 4 letters, 2 address digits, then arguments
+        command, args = text[:4], text[6:]
+        if command == 'GMAX':
+            return self.gmax + "\rOK\r"
+        if command == 'GETD':
+            volts, amps = self.display()
+            return "%04d%04d0\rOK\r" % (round(volts * 100), round(amps * 100))
+        if command == 'RUNP':
+            self.program = args
+            self._program_start = perf_counter()
+        elif command == 'STOP':
+            self.program = None
+        elif command not in ('SESS', 'ENDS', 'SOUT'):
+            return ""  # the 1696 does not answer unknown commands
+        return "OK\r"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the ETA power supply on a pseudo-terminal.")
+    parser.add_argument("--protocol", choices=["psoc", "bk"], default="psoc")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in s")
+    args = parser.parse_args()
+    emulator = PowerSupplyEmulator(args.protocol, args.latency)
+    emulator.start()
+    print("Emulated", args.protocol, "power supply on", emulator.port)
+    shown = 0
+    try:
+        while True:
+            time.sleep(0.1)
+            while shown < len(emulator.log):
+                received, text = emulator.log[shown]
+                print("%.6f" % received, repr(text))
+                shown += 1
+    except KeyboardInterrupt:
+        emulator.stop()
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,11 @@
 #  reduced Minimum integration interval to accommodate PMT pulse data.
 ## 11/2024 added button to do time shift of multi-channel data (PMT data)
 ## 01/2025 added integration outputs to support peak-to-peak estimates of noise
+## 10/2026 Load Spec Data also opens binary .npz run files (ETAacquisition.load_run);
+#  one file holds line, bkg and base, output files are named as for the text files.
+## 10/2026 'Zero at start command' shifts loaded spec data so that t = 0 is the power supply
+#  start command recorded in the file ("# Event start ..."), no clicking needed to align replicates.
+## 10/2026 temperature formula shared with the BK telemetry recording (ETAacquisition.filament_temperature)
 
 import os
 import time
@@ -25,6 +30,8 @@ import matplotlib.lines as lines
 from matplotlib.widgets import SpanSelector
 from matplotlib.widgets import Cursor 
 
+from ETAacquisition import load_run, read_events, filament_temperature
+
 try:
     import Tkinter as tk
 except ImportError:
@@ -81,6 +88,13 @@ class MainWindow(tk.Frame):
         self.Extract3rdChannel_button.grid(row=10,column=1)
         self.Extract3rdChannel_button.bind('<ButtonRelease-1>', self.Extract_Third_Channel)        
 
+        self.AlignStart_button = tk.Button(text = "Zero at start command")
+        self.AlignStart_button.grid(row=11,column=1)
+        self.AlignStart_button.bind('<ButtonRelease-1>', self.Align_StartCommand)
+        self.AlignStart_label = tk.Label(text = "Time shift on loaded \nspec data")
+        self.AlignStart_label.grid(row=11,column=0)
+        self.events = {}
+
 # Temperature data section
         tk.Label(text = "Temperature data", font='bold', fg='blue').grid(row=20,column=0,columnspan=2)
         self.load_scopetempdata_button = tk.Button(text = 'Load Scope Data')
@@ -121,16 +135,28 @@ class MainWindow(tk.Frame):
 
 # functions for processing optical data
     def Load_SpecData(self, event):
-        filenames = tk.filedialog.askopenfilename(title = "Load ETA data", filetypes = [("Text file",".txt"),("CSV file",".csv")], defaultextension='.txt', multiple=True)
+        filenames = tk.filedialog.askopenfilename(title = "Load ETA data", filetypes = [("Text file",".txt"),("CSV file",".csv"),("ETA run (binary)",".npz")], defaultextension='.txt', multiple=True)
         if not filenames:
             pass  #exits on Cancel
         else:
             for file_name in filenames:
                 path_ext = os.path.splitext(file_name)
+                if path_ext[1].lower() == '.npz':  # binary run file holds all three channels
+                    run = load_run(file_name)
+                    missing = [name for name in ("line", "bkg", "base") if name not in run["channels"]]
+                    if missing:
+                        tk.messagebox.showinfo(title="oops!", message=os.path.basename(file_name) + " has no " + ", ".join(missing) + " channel.\nLoad a time-series run.")
+                        continue
+                    self.events = run["events"]
+                    columns = [run["channels"].index(name) for name in ("line", "bkg", "base")]
+                    self.linefile, self.bkgfile, self.basefile = (path_ext[0] + name for name in ("line", "bkg", "base"))
+                    self.data_line, self.data_bkg, self.data_base = (np.vstack((run["times"], run["counts"][:, i])).astype(float) for i in columns)
+                    continue
                 if 'line' in file_name:
                     path_ext = os.path.splitext(file_name)
                     self.linefile = path_ext[0]
                     self.data_line = np.genfromtxt(str(self.linefile+path_ext[1]), unpack = True, dtype='float', delimiter=",", comments='#')
+                    self.events = read_events(file_name)  # same markers in all three files
                 if 'bkg' in file_name:
                     path_ext = os.path.splitext(file_name)
                     self.bkgfile = path_ext[0]
@@ -322,6 +348,29 @@ class MainWindow(tk.Frame):
         ax.figure.canvas.draw()
 # --- end
 
+# Shift loaded spec data so the power supply start command is time zero
+    def Align_StartCommand(self, event):
+        starts = [t for name, t in self.events.items() if name.startswith("start")]
+        if not starts:
+            tk.messagebox.showinfo(title="No start command", message="The loaded file has no start command event.")
+            return
+        if starts[0] == 0:
+            tk.messagebox.showinfo(title="Time shifted", message="The start command is already at time zero.")
+            return
+        self.data_time = self.data_time - starts[0]
+        for name in self.events:
+            self.events[name] -= starts[0]
+        # save the shifted channels as Set_TimeZero does, so later steps can be redone from them
+        shiftedfiles = []
+        for datafile, data in ((self.linefile, self.data_line), (self.bkgfile, self.data_bkg), (self.basefile, self.data_base)):
+            shiftedfile = str(datafile + "_shift.txt")
+            shiftheader = "# File " + os.path.basename(datafile) + " shifted by time = " + str(np.around(starts[0], 4)) + " (start command at zero)\n# Time (s), Counts"
+            np.savetxt(shiftedfile, np.transpose([self.data_time, data[1]]), delimiter=',', newline='\n', header=shiftheader, comments='')
+            shiftedfiles.append(os.path.basename(shiftedfile))
+        self.AlignStart_label.config(text = "Shifted by " + str(np.around(starts[0], 4)) + " s")
+        tk.messagebox.showinfo(title="Time shifted", message="Start command is now time zero, shifted by " + str(np.around(starts[0], 4)) + " s.\nSaved " + ", ".join(shiftedfiles))
+# --- end
+
 # Extract Third Channel for PMT-based data
     def Extract_Third_Channel(self, event):
         filenames = tk.filedialog.askopenfilename(title = "Load data", filetypes = [("CSV file","*.csv"), ("Text file","*.txt")], defaultextension='.csv', multiple=False)
@@ -386,12 +435,8 @@ class MainWindow(tk.Frame):
             self.data_current = scopedata[0], scopedata[2]
 
     def Calc_Temperature(self, event):
-        temp = self.data_voltage[1] / self.data_current[1]
-        temp = temp ** 0.8226  #coefficient for 15-volt filament
-        temp = (temp * 2759.45) - 51.7749 #coefficient for 15-volt filament
-        # added to deal with 'nan' values  -- problem is due to small voltage offsets in the current probe
-        temp[np.isnan(temp)] = 0
-        # end added part
+        temp = filament_temperature(self.data_voltage[1], self.data_current[1])  # coefficients for 15-volt filament
+        # 'nan' values are set to 0 -- problem is due to small voltage offsets in the current probe
         self.temperature = self.data_voltage[0], temp
         #voltagefile = str(self.scopefile + "_voltage.txt")  #consider changing to self.path_ext[1] for flexible extension use
         #currentfile = str(self.scopefile + "_current.txt")
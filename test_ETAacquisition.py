@@ -0,0 +1,30 @@
+## Tests of the shared acquisition helpers; run with  python -m pytest -q
+
+import numpy as np
+
+from ETAacquisition import nearest_frames, SpectrumStream
+
+
+def test_nearest_frames():
+    index = nearest_frames([0.0, 0.9, 1.6, 5.0], [0.1, 1.0, 2.0])
+    assert index.tolist() == [0, 1, 2, 2]
+
+
+def test_nearest_frames_single_frame():
+    assert nearest_frames([0.0, 1.0], [0.5]).tolist() == [0, 0]
+
+
+def test_nearest_frames_no_frames():
+    # a device that read nothing (e.g. a read error on its first frame)
+    index = nearest_frames([0.0, 0.01, 0.02], [])
+    assert index.tolist() == [-1, -1, -1]
+    assert nearest_frames([], []).size == 0
+
+
+def test_spectrum_stream_without_frames(tmp_path):
+    # a capture cancelled or failed before its first frame
+    stream = SpectrumStream(str(tmp_path / "capture"), np.arange(16.0))
+    stream.close()
+    assert stream.spectra().shape == (0, 16)
+    assert stream.times().shape == (0,)
+    stream.delete()